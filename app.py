@@ -1,33 +1,35 @@
 import os
 import io
 import logging
-import requests
 import base64
 import asyncio
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import Optional, Dict, Any, List
 from pathlib import Path
 import json
 
 # Document processing imports
-import PyPDF2
+import pypdfium2
 from docx import Document
-import tempfile
+from blake3 import blake3
 
+import httpx
 import redis
-from flask import Flask, request, jsonify
+from flask import Flask, request
+from flask.json.provider import JSONProvider
 from telegram import Bot
 from telegram.error import TelegramError
 from dotenv import load_dotenv
+import orjson
 
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
-from langchain_core.runnables.history import RunnableWithMessageHistory
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from persistent_memory import DatabaseChatMessageHistory, DatabaseDocumentManager, UserSessionManager, cleanup_all_old_messages, cleanup_old_documents
+from persistent_memory import DatabaseChatMessageHistory, DatabaseDocumentManager, UserSessionManager, cleanup_all_old_messages, cleanup_old_documents, get_history
 from serper_tools import SerperAPI, SearchFormatter
+from semantic_cache import SemanticResponseCache
 
 # Load environment variables
 load_dotenv()
@@ -36,6 +38,58 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+
+# System-prompt templates are built once; per-message work is reduced to a
+# couple of .format calls. The timestamp is rounded to the minute so
+# identical prompts within a minute stay identical for the semantic cache.
+_SYSTEM_TEMPLATE = """You are a helpful assistant called Wizzy.
+Respond in a natural funny tone.
+Be sarcastic when required.
+Don't give very long messages.
+
+You are currently talking to {user_name}.
+
+The current date and time is {current_time}
+
+You have access to real-time web search capabilities to provide current information when needed."""
+
+_SEARCH_CONTEXT_TEMPLATE = """
+
+## Current Web Search Results:
+{search_context}
+
+Use this information to provide accurate, up-to-date answers. Always cite your sources when using web search results."""
+
+_DOCUMENT_CONTEXT_TEMPLATE = """
+
+## Document Context Available:
+The user has uploaded a document: {filename}
+You can reference and answer questions about this document.
+Document summary: {summary}"""
+
+
+class OrJSONProvider(JSONProvider):
+    """orjson-backed JSON provider for Flask
+
+    Routes request.get_json() and jsonify through orjson, so webhook
+    payload parsing gets the fast path by default instead of only at the
+    hand-written response_class call sites.
+    """
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
+def _post_json(session, url, payload, **kwargs):
+    """POST an orjson-serialized JSON payload (much faster than stdlib json)"""
+    headers = kwargs.pop('headers', None) or {}
+    headers.setdefault('Content-Type', 'application/json')
+    return session.post(url, content=orjson.dumps(payload), headers=headers, **kwargs)
+
+
 class WizzyBot:
     def __init__(self):
         # Initialize credentials (set these as environment variables)
@@ -49,10 +103,27 @@ class WizzyBot:
         self.quota_cooldown_until = None
         self.cooldown_duration = 3600  # 1 hour in seconds
 
+        # Shared pool for overlapping independent network I/O (typing
+        # indicators, follow-up sends) with the main processing path
+        self.io_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix='wizzy-io')
+
+        # Bound concurrent Gemini calls so bursts don't trip rate limits
+        self.gemini_semaphore = threading.Semaphore(8)
+
+        # Summaries keyed by document content hash, so re-uploads of the
+        # same file skip the Gemini summarization call entirely
+        self._doc_summary_cache: Dict[str, str] = {}
+
         # Initialize services
         self.bot = Bot(token=self.telegram_token)
         self.redis_client = redis.from_url(self.redis_url)
 
+        # Long-lived HTTP/2 clients (one per host): handshakes are paid once
+        # and concurrent calls multiplex over a single TLS connection
+        self.tg_session = self._create_session()
+        self.gemini_session = self._create_session()
+        self.groq_session = self._create_session()
+
         # Initialize LLM models
         self.chat_model = ChatGoogleGenerativeAI(
             model="gemini-1.5-flash",
@@ -62,6 +133,7 @@ class WizzyBot:
 
         # Use requests for direct API calls instead of deprecated GoogleGenerativeAI
         self.gemini_api_base = "https://generativelanguage.googleapis.com/v1beta"
+        self.gemini_upload_url = "https://generativelanguage.googleapis.com/upload/v1beta/files"
         
         # Serper API configuration
         self.serper_api_base = "https://google.serper.dev"
@@ -69,34 +141,34 @@ class WizzyBot:
         # Initialize persistent storage managers
         self.document_manager = DatabaseDocumentManager()
         self.session_manager = UserSessionManager()
+
+        # Semantic response cache: repeated/similar prompts skip Gemini entirely
+        self.response_cache = SemanticResponseCache(
+            self.redis_client,
+            self.google_api_key,
+            session=self.gemini_session
+        )
         
         # Initialize enhanced Serper API client
         if self.serper_api_key:
             self.serper_client = SerperAPI(self.serper_api_key)
         else:
             self.serper_client = None
-        
-        # Create the chat prompt template with memory
-        self.prompt = ChatPromptTemplate.from_messages([
-            ("system", "{system_message}"),
-            MessagesPlaceholder(variable_name="history"),
-            ("human", "{input}")
-        ])
-        
-        # Create the chain with memory
-        self.chain = self.prompt | self.chat_model
-        
-        # Create the chain with message history
-        self.chain_with_history = RunnableWithMessageHistory(
-            self.chain,
-            self.get_session_history,
-            input_messages_key="input",
-            history_messages_key="history",
+
+
+    @staticmethod
+    def _create_session() -> httpx.Client:
+        """Create a pooled HTTP/2 client with keep-alive and connect retries"""
+        transport = httpx.HTTPTransport(
+            http2=True,
+            retries=3,
+            limits=httpx.Limits(max_connections=32, max_keepalive_connections=16)
         )
+        return httpx.Client(transport=transport, timeout=60)
 
     def get_session_history(self, session_id: str) -> DatabaseChatMessageHistory:
         """Get or create database-backed chat message history for a session"""
-        return DatabaseChatMessageHistory(session_id)
+        return get_history(session_id)
     
     def is_in_quota_cooldown(self) -> bool:
         """Check if we're in quota cooldown period"""
@@ -135,90 +207,105 @@ class WizzyBot:
 
     def create_system_message(self, user_name: str, chat_id: str = None, search_context: str = None) -> str:
         """Create dynamic system message with optional document context and search results"""
-        current_time = datetime.now().isoformat()
-        base_message = f"""You are a helpful assistant called Wizzy.
-Respond in a natural funny tone.
-Be sarcastic when required.
-Don't give very long messages.
-
-You are currently talking to {user_name}.
+        current_time = datetime.now().replace(second=0, microsecond=0).isoformat()
+        parts = [_SYSTEM_TEMPLATE.format(user_name=user_name, current_time=current_time)]
 
-The current date and time is {current_time}
-
-You have access to real-time web search capabilities to provide current information when needed."""
-        
         # Add search context if available
         if search_context:
-            base_message += f"""
-
-## Current Web Search Results:
-{search_context}
+            parts.append(_SEARCH_CONTEXT_TEMPLATE.format(search_context=search_context))
 
-Use this information to provide accurate, up-to-date answers. Always cite your sources when using web search results."""
-        
         # Add document context if available
         if chat_id:
-            doc_info = self.document_manager.get_document(chat_id)
+            doc_info = self.document_manager.get_document_metadata(chat_id)
             if doc_info:
-                base_message += f"""
+                parts.append(_DOCUMENT_CONTEXT_TEMPLATE.format(
+                    filename=doc_info['filename'],
+                    summary=doc_info.get('summary', 'Content available for discussion')
+                ))
 
-## Document Context Available:
-The user has uploaded a document: {doc_info['filename']}
-You can reference and answer questions about this document.
-Document summary: {doc_info.get('summary', 'Content available for discussion')}"""
-        
-        return base_message
+        return "".join(parts)
 
-    def download_telegram_file(self, file_id: str) -> bytes:
-        """Download file from Telegram"""
+    def download_telegram_file(self, file_id: str):
+        """Stream a file from Telegram, returning (content hash, BytesIO buffer)"""
         try:
             # Use direct HTTP request to get file info to avoid async issues
             url = f"https://api.telegram.org/bot{self.telegram_token}/getFile"
             data = {'file_id': file_id}
-            response = requests.post(url, json=data)
+            response = _post_json(self.tg_session, url, data)
             response.raise_for_status()
-            
+
             file_info = response.json()['result']['file_path']
-            
-            # Download the actual file
+
+            # Stream the download in 64KB chunks, hashing incrementally so
+            # the dedup key is computed during the transfer; the full file
+            # is still buffered because the extractors need random access
             file_url = f"https://api.telegram.org/file/bot{self.telegram_token}/{file_info}"
-            file_response = requests.get(file_url)
-            file_response.raise_for_status()
-            return file_response.content
+            hasher = blake3()
+            buf = io.BytesIO()
+            with self.tg_session.stream("GET", file_url) as file_response:
+                file_response.raise_for_status()
+                for chunk in file_response.iter_bytes(chunk_size=65536):
+                    hasher.update(chunk)
+                    buf.write(chunk)
+            buf.seek(0)
+            return hasher.hexdigest(), buf
         except Exception as e:
             logger.error(f"Error downloading file: {e}")
             raise
 
+    def _upload_media_to_gemini(self, media_data: bytes, mime_type: str) -> Optional[str]:
+        """Upload raw media bytes via the Gemini Files API and return the file URI"""
+        try:
+            headers = {
+                "X-Goog-Upload-Protocol": "raw",
+                "Content-Type": mime_type
+            }
+            response = self.gemini_session.post(
+                f"{self.gemini_upload_url}?key={self.google_api_key}",
+                content=media_data,
+                headers=headers
+            )
+            response.raise_for_status()
+            return response.json()["file"]["uri"]
+        except Exception as e:
+            logger.error(f"Error uploading media to Gemini Files API: {e}")
+            return None
+
+    def _build_media_part(self, media_data: bytes, mime_type: str) -> Dict[str, Any]:
+        """Build a Gemini content part, preferring a file reference over inline base64"""
+        file_uri = self._upload_media_to_gemini(media_data, mime_type)
+        if file_uri:
+            return {"file_data": {"mime_type": mime_type, "file_uri": file_uri}}
+
+        # Fallback: inline base64 (33% larger payload, but always works)
+        return {
+            "inline_data": {
+                "mime_type": mime_type,
+                "data": base64.b64encode(media_data).decode()
+            }
+        }
+
     def transcribe_audio(self, audio_data: bytes) -> str:
         """Transcribe audio using Google Gemini API directly"""
         try:
-            # Convert audio to base64
-            audio_b64 = base64.b64encode(audio_data).decode()
-
             url = f"{self.gemini_api_base}/models/gemini-1.5-flash:generateContent"
 
             payload = {
                 "contents": [{
                     "parts": [
                         {"text": "Please transcribe this audio:"},
-                        {
-                            "inline_data": {
-                                "mime_type": "audio/ogg",
-                                "data": audio_b64
-                            }
-                        }
+                        self._build_media_part(audio_data, "audio/ogg")
                     ]
                 }]
             }
 
-            headers = {"Content-Type": "application/json"}
-
-            response = requests.post(
-                f"{url}?key={self.google_api_key}",
-                json=payload,
-                headers=headers
-            )
-            response.raise_for_status()
+            with self.gemini_semaphore:
+                response = _post_json(
+                    self.gemini_session,
+                    f"{url}?key={self.google_api_key}",
+                    payload
+                )
+                response.raise_for_status()
 
             result = response.json()
             return result["candidates"][0]["content"]["parts"][0]["text"].strip()
@@ -234,9 +321,6 @@ Document summary: {doc_info.get('summary', 'Content available for discussion')}"
     def analyze_image(self, image_data: bytes, caption: Optional[str] = None) -> str:
         """Analyze image using Google Gemini Vision API directly"""
         try:
-            # Convert image to base64
-            image_b64 = base64.b64encode(image_data).decode()
-
             prompt = caption if caption else "Describe this image in detail."
 
             url = f"{self.gemini_api_base}/models/gemini-1.5-flash:generateContent"
@@ -245,24 +329,18 @@ Document summary: {doc_info.get('summary', 'Content available for discussion')}"
                 "contents": [{
                     "parts": [
                         {"text": prompt},
-                        {
-                            "inline_data": {
-                                "mime_type": "image/jpeg",
-                                "data": image_b64
-                            }
-                        }
+                        self._build_media_part(image_data, "image/jpeg")
                     ]
                 }]
             }
 
-            headers = {"Content-Type": "application/json"}
-
-            response = requests.post(
-                f"{url}?key={self.google_api_key}",
-                json=payload,
-                headers=headers
-            )
-            response.raise_for_status()
+            with self.gemini_semaphore:
+                response = _post_json(
+                    self.gemini_session,
+                    f"{url}?key={self.google_api_key}",
+                    payload
+                )
+                response.raise_for_status()
 
             result = response.json()
             return result["candidates"][0]["content"]["parts"][0]["text"].strip()
@@ -377,7 +455,7 @@ Document summary: {doc_info.get('summary', 'Content available for discussion')}"
                 "response_format": "mp3"
             }
 
-            response = requests.post(url, json=data, headers=headers)
+            response = _post_json(self.groq_session, url, data, headers=headers)
             response.raise_for_status()
             return response.content
         except Exception as e:
@@ -387,53 +465,46 @@ Document summary: {doc_info.get('summary', 'Content available for discussion')}"
     def extract_text_from_pdf(self, pdf_data: bytes) -> str:
         """Extract text from PDF document"""
         try:
-            with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as temp_file:
-                temp_file.write(pdf_data)
-                temp_file.flush()
-                
-                with open(temp_file.name, 'rb') as file:
-                    pdf_reader = PyPDF2.PdfReader(file)
-                    text = ""
-                    for page in pdf_reader.pages:
-                        text += page.extract_text() + "\n"
-                
-                os.unlink(temp_file.name)  # Clean up temp file
-                return text.strip()
+            pdf = pypdfium2.PdfDocument(pdf_data)
+            try:
+                # PDFium is not thread-safe and pypdfium2 adds no locking:
+                # pages must be extracted serially from one document handle
+                texts = [page.get_textpage().get_text_range() for page in pdf]
+                return "\n".join(texts).strip()
+            finally:
+                pdf.close()
         except Exception as e:
             logger.error(f"Error extracting text from PDF: {e}")
             return ""
 
-    def extract_text_from_docx(self, docx_data: bytes) -> str:
-        """Extract text from DOCX document"""
+    def extract_text_from_docx(self, docx_data) -> str:
+        """Extract text from DOCX document (bytes or file-like)"""
         try:
-            with tempfile.NamedTemporaryFile(suffix='.docx', delete=False) as temp_file:
-                temp_file.write(docx_data)
-                temp_file.flush()
-                
-                doc = Document(temp_file.name)
-                text = ""
-                for paragraph in doc.paragraphs:
-                    text += paragraph.text + "\n"
-                
-                os.unlink(temp_file.name)  # Clean up temp file
-                return text.strip()
+            doc = Document(docx_data if hasattr(docx_data, 'read') else io.BytesIO(docx_data))
+            text = ""
+            for paragraph in doc.paragraphs:
+                text += paragraph.text + "\n"
+            return text.strip()
         except Exception as e:
             logger.error(f"Error extracting text from DOCX: {e}")
             return ""
 
-    def extract_text_from_txt(self, txt_data: bytes) -> str:
-        """Extract text from TXT document"""
+    def extract_text_from_txt(self, txt_data) -> str:
+        """Extract text from TXT document (bytes or file-like)"""
         try:
+            if hasattr(txt_data, 'getvalue'):
+                txt_data = txt_data.getvalue()
             return txt_data.decode('utf-8', errors='ignore').strip()
         except Exception as e:
             logger.error(f"Error extracting text from TXT: {e}")
             return ""
 
-    def process_document(self, document_data: bytes, filename: str, chat_id: str) -> str:
-        """Process uploaded document and extract text"""
+    def process_document(self, document_data, filename: str, chat_id: str,
+                         content_hash: str = None) -> str:
+        """Process uploaded document (bytes or file-like) and extract text"""
         try:
             file_extension = Path(filename).suffix.lower()
-            
+
             if file_extension == '.pdf':
                 text = self.extract_text_from_pdf(document_data)
             elif file_extension == '.docx':
@@ -442,21 +513,77 @@ Document summary: {doc_info.get('summary', 'Content available for discussion')}"
                 text = self.extract_text_from_txt(document_data)
             else:
                 return f"Unsupported document format: {file_extension}. I support PDF, DOCX, and TXT files."
-            
+
             if not text:
                 return f"Sorry, I couldn't extract any text from {filename}. The document might be empty or corrupted."
-            
-            # Generate a summary of the document
-            summary_prompt = f"Please provide a brief summary (2-3 sentences) of this document:\n\n{text[:2000]}..."
-            
-            try:
-                summary_response = self.chat_model.invoke([HumanMessage(content=summary_prompt)])
-                summary = summary_response.content
-            except:
-                summary = f"Document with {len(text.split())} words uploaded."
-            
-            # Store document in database
-            file_size = len(document_data)
+
+            # Cap stored content so a single upload can't pin megabytes of
+            # extracted text in the database and caches
+            text = text[:200_000]
+
+            if hasattr(document_data, 'getbuffer'):
+                file_size = document_data.getbuffer().nbytes
+            else:
+                file_size = len(document_data)
+
+            # The streaming download already hashed the content; only hash
+            # here when handed raw bytes directly
+            if content_hash is None:
+                content_hash = blake3(
+                    document_data.getbuffer() if hasattr(document_data, 'getbuffer') else document_data
+                ).hexdigest()
+
+            # Summarize and store in the background so the user gets an
+            # immediate ack instead of waiting on a Gemini round-trip
+            self.io_pool.submit(
+                self._summarize_and_store,
+                text, filename, chat_id, file_extension, file_size, content_hash
+            )
+
+            return f"📄 Got your document '{filename}'! I'm reading through it now and will send you a summary in a moment."
+
+        except Exception as e:
+            logger.error(f"Error processing document: {e}")
+            return f"Sorry, I encountered an error processing {filename}. Please try uploading it again."
+
+    def _summarize_and_store(self, text: str, filename: str, chat_id: str,
+                             file_extension: str, file_size: int, content_hash: str = None):
+        """Background task: summarize a document, store it, and send the summary"""
+        try:
+            summary = self._doc_summary_cache.get(content_hash) if content_hash else None
+
+            progress_message_id = None
+            if summary is None:
+                summary_prompt = f"Please provide a brief summary (2-3 sentences) of this document:\n\n{text[:2000]}..."
+
+                # Stream the summary and progressively edit a single Telegram
+                # message so the user sees it form instead of waiting for the
+                # full completion
+                progress_message_id = self.send_text_response(
+                    int(chat_id), f"📝 Summarizing '{filename}'..."
+                )
+                try:
+                    chunks = []
+                    with self.gemini_semaphore:
+                        for chunk in self.chat_model.stream([HumanMessage(content=summary_prompt)]):
+                            if chunk.content:
+                                chunks.append(chunk.content)
+                                if progress_message_id and len(chunks) % 5 == 0:
+                                    self.edit_message_text(
+                                        int(chat_id), progress_message_id, "".join(chunks)
+                                    )
+                    summary = "".join(chunks).strip()
+                    if not summary:
+                        raise ValueError("Empty summary from model")
+                except:
+                    summary = f"Document with {len(text.split())} words uploaded."
+
+                if content_hash:
+                    # Keep the dedup cache bounded (dicts preserve insertion order)
+                    if len(self._doc_summary_cache) >= 256:
+                        self._doc_summary_cache.pop(next(iter(self._doc_summary_cache)))
+                    self._doc_summary_cache[content_hash] = summary
+
             success = self.document_manager.store_document(
                 session_id=chat_id,
                 filename=filename,
@@ -465,18 +592,21 @@ Document summary: {doc_info.get('summary', 'Content available for discussion')}"
                 file_type=file_extension,
                 file_size=file_size
             )
-            
+
             if not success:
                 logger.error(f"Failed to store document {filename} for chat {chat_id}")
-                return f"Sorry, I couldn't save your document. Please try again."
-            
+                self.send_text_response(int(chat_id), "Sorry, I couldn't save your document. Please try again.")
+                return
+
             logger.info(f"Document {filename} processed and stored for chat {chat_id}")
-            
-            return f"📄 Great! I've processed your document '{filename}' and I'm ready to answer questions about it!\n\n📝 **Summary:** {summary}\n\nJust ask me anything about the document!"
-        
+
+            final_text = f"📝 **Summary of '{filename}':** {summary}\n\nJust ask me anything about the document!"
+            if progress_message_id:
+                self.edit_message_text(int(chat_id), progress_message_id, final_text)
+            else:
+                self.send_text_response(int(chat_id), final_text)
         except Exception as e:
-            logger.error(f"Error processing document: {e}")
-            return f"Sorry, I encountered an error processing {filename}. Please try uploading it again."
+            logger.error(f"Error summarizing document: {e}")
 
     def process_document_message(self, message_data: Dict[str, Any]) -> str:
         """Process document message"""
@@ -490,12 +620,12 @@ Document summary: {doc_info.get('summary', 'Content available for discussion')}"
             if file_size > 20 * 1024 * 1024:  # 20MB limit
                 return "Sorry, the document is too large. Please upload files smaller than 20MB."
             
-            # Download document
-            document_data = self.download_telegram_file(file_id)
-            
+            # Download document (streamed, hashed on the fly for dedup)
+            content_hash, document_buf = self.download_telegram_file(file_id)
+
             # Process the document
             chat_id = str(message_data['chat']['id'])
-            return self.process_document(document_data, filename, chat_id)
+            return self.process_document(document_buf, filename, chat_id, content_hash)
             
         except Exception as e:
             logger.error(f"Error processing document message: {e}")
@@ -503,37 +633,69 @@ Document summary: {doc_info.get('summary', 'Content available for discussion')}"
 
     def process_text_message(self, message_data: Dict[str, Any]) -> str:
         """Process text message through AI agent with memory and optional web search"""
+        chat_id = str(message_data['chat']['id'])
+        user_name = message_data['from']['first_name'].split(' ')[0]
+        return self._run_text(chat_id, user_name, message_data['text'])
+
+    def _run_text(self, chat_id: str, user_name: str, text: str) -> str:
+        """Run a text prompt through the AI agent with memory and optional web search"""
         # Check if we're in cooldown mode first
         if self.is_in_quota_cooldown():
             return self.get_cooldown_message()
-        
+
         try:
-            chat_id = str(message_data['chat']['id'])
-            user_name = message_data['from']['first_name'].split(' ')[0]
-            text = message_data['text']
+            # Serve semantically similar prompts straight from cache, skipping
+            # it when a document is loaded (answers depend on its content) or
+            # the prompt is time-sensitive (a day-old cached answer to "latest
+            # news on X" is worse than no cache)
+            has_document = self.document_manager.get_document_metadata(chat_id) is not None
+            # Time-sensitivity alone decides cacheability: even without a
+            # serper client, "bitcoin price today" must not be served stale
+            time_sensitive = self.should_search_web(text)
+            cacheable = not has_document and not time_sensitive
+            prompt_embedding = None
+            if cacheable:
+                cached_response, prompt_embedding = self.response_cache.lookup(chat_id, text)
+                if cached_response:
+                    # Cache-served turns still belong in conversation memory
+                    history = self.get_session_history(chat_id)
+                    history.add_message(HumanMessage(content=text))
+                    history.add_message(AIMessage(content=cached_response))
+                    return cached_response
 
             # Check if we should search the web for current information
             search_context = None
-            if self.should_search_web(text):
+            if time_sensitive and self.serper_client:
                 logger.info(f"Performing web search for query: {text}")
-                search_results = self.search_web(text, num_results=5)
-                if search_results["success"]:
-                    search_context = self.format_search_results(search_results)
-                    logger.info(f"Web search successful, found {search_results['total_results']} results")
+                # Fused fetch+format path: one pass over the raw JSON with
+                # no intermediate result objects
+                search_context = self.serper_client.search_and_format_for_ai(text, num_results=5)
+                if search_context:
+                    logger.info("Web search successful")
                 else:
-                    logger.warning(f"Web search failed: {search_results.get('error', 'Unknown error')}")
+                    logger.warning("Web search failed or returned no results")
 
             # Create system message with context (including document context and search results)
             system_message = self.create_system_message(user_name, chat_id, search_context)
 
-            # Generate response using chain with memory
-            response = self.chain_with_history.invoke(
-                {
-                    "input": text,
-                    "system_message": system_message
-                },
-                config={"configurable": {"session_id": chat_id}}
-            )
+            # Call the model directly with the materialized history; skipping
+            # the LangChain runnable tree avoids its per-invoke reflection
+            history = self.get_session_history(chat_id)
+            with self.gemini_semaphore:
+                response = self.chat_model.invoke([
+                    SystemMessage(content=system_message),
+                    *history.messages,
+                    HumanMessage(content=text)
+                ])
+
+            # Persist the turn
+            history.add_message(HumanMessage(content=text))
+            history.add_message(AIMessage(content=response.content))
+
+            if cacheable:
+                # Reuse the embedding computed during lookup
+                self.response_cache.store(chat_id, text, response.content,
+                                          embedding=prompt_embedding)
 
             return response.content
 
@@ -551,14 +713,12 @@ Document summary: {doc_info.get('summary', 'Content available for discussion')}"
             voice_file_id = message_data['voice']['file_id']
 
             # Download and transcribe audio
-            audio_data = self.download_telegram_file(voice_file_id)
-            transcribed_text = self.transcribe_audio(audio_data)
+            _, audio_buf = self.download_telegram_file(voice_file_id)
+            transcribed_text = self.transcribe_audio(audio_buf.getvalue())
 
-            # Create fake text message for processing
-            fake_message = message_data.copy()
-            fake_message['text'] = transcribed_text
-
-            return self.process_text_message(fake_message)
+            chat_id = str(message_data['chat']['id'])
+            user_name = message_data['from']['first_name'].split(' ')[0]
+            return self._run_text(chat_id, user_name, transcribed_text)
 
         except Exception as e:
             logger.error(f"Error processing audio message: {e}")
@@ -567,13 +727,14 @@ Document summary: {doc_info.get('summary', 'Content available for discussion')}"
     def process_image_message(self, message_data: Dict[str, Any]) -> str:
         """Process image message"""
         try:
-            # Get the highest resolution photo
-            photos = message_data['photo']
-            largest_photo = max(photos, key=lambda x: x['file_size'])
+            # Telegram sends photo sizes sorted ascending, so the last
+            # entry is the highest resolution
+            largest_photo = message_data['photo'][-1]
             photo_file_id = largest_photo['file_id']
 
             # Download image
-            image_data = self.download_telegram_file(photo_file_id)
+            _, image_buf = self.download_telegram_file(photo_file_id)
+            image_data = image_buf.getvalue()
 
             # Analyze image
             caption = message_data.get('caption', 'Describe this image in detail.')
@@ -588,11 +749,9 @@ Document summary: {doc_info.get('summary', 'Content available for discussion')}"
 ## User Message:
 {caption}"""
 
-            # Process as text message
-            fake_message = message_data.copy()
-            fake_message['text'] = enhanced_prompt
-
-            return self.process_text_message(fake_message)
+            chat_id = str(message_data['chat']['id'])
+            user_name = message_data['from']['first_name'].split(' ')[0]
+            return self._run_text(chat_id, user_name, enhanced_prompt)
 
         except Exception as e:
             logger.error(f"Error processing image message: {e}")
@@ -602,8 +761,21 @@ Document summary: {doc_info.get('summary', 'Content available for discussion')}"
         """Check if original message was voice to respond with voice"""
         return 'voice' in message_data
 
-    def send_text_response(self, chat_id: int, text: str):
-        """Send text response to Telegram"""
+    def send_chat_action(self, chat_id: int, action: str = 'typing'):
+        """Send a chat action (typing indicator) to Telegram"""
+        try:
+            url = f"https://api.telegram.org/bot{self.telegram_token}/sendChatAction"
+            data = {
+                'chat_id': chat_id,
+                'action': action
+            }
+            response = _post_json(self.tg_session, url, data)
+            response.raise_for_status()
+        except Exception as e:
+            logger.error(f"Error sending chat action: {e}")
+
+    def send_text_response(self, chat_id: int, text: str) -> Optional[int]:
+        """Send text response to Telegram, returning the sent message id"""
         try:
             # Use requests for synchronous HTTP call to avoid async issues
             url = f"https://api.telegram.org/bot{self.telegram_token}/sendMessage"
@@ -611,10 +783,26 @@ Document summary: {doc_info.get('summary', 'Content available for discussion')}"
                 'chat_id': chat_id,
                 'text': text
             }
-            response = requests.post(url, json=data)
+            response = _post_json(self.tg_session, url, data)
             response.raise_for_status()
+            return response.json()['result']['message_id']
         except Exception as e:
             logger.error(f"Error sending text message: {e}")
+            return None
+
+    def edit_message_text(self, chat_id: int, message_id: int, text: str):
+        """Edit a previously sent Telegram message in place"""
+        try:
+            url = f"https://api.telegram.org/bot{self.telegram_token}/editMessageText"
+            data = {
+                'chat_id': chat_id,
+                'message_id': message_id,
+                'text': text
+            }
+            response = _post_json(self.tg_session, url, data)
+            response.raise_for_status()
+        except Exception as e:
+            logger.error(f"Error editing message: {e}")
 
     def send_audio_response(self, chat_id: int, text: str):
         """Send audio response to Telegram"""
@@ -625,7 +813,7 @@ Document summary: {doc_info.get('summary', 'Content available for discussion')}"
                 url = f"https://api.telegram.org/bot{self.telegram_token}/sendAudio"
                 files = {'audio': ('response.mp3', io.BytesIO(audio_data), 'audio/mpeg')}
                 data = {'chat_id': chat_id}
-                response = requests.post(url, files=files, data=data)
+                response = self.tg_session.post(url, files=files, data=data)
                 response.raise_for_status()
             else:
                 # Fallback to text if TTS fails
@@ -644,6 +832,9 @@ Document summary: {doc_info.get('summary', 'Content available for discussion')}"
             if not chat_id:
                 return
 
+            # Show a typing indicator concurrently while we process
+            self.io_pool.submit(self.send_chat_action, chat_id)
+
             # Determine message type and process accordingly
             if 'voice' in message:
                 # Audio message
@@ -675,6 +866,22 @@ Document summary: {doc_info.get('summary', 'Content available for discussion')}"
             if chat_id:
                 self.send_text_response(chat_id, "Sorry, I encountered an error.")
 
+# Background job queue worker
+def process_job_queue():
+    """Background task: pop queued Telegram updates and dispatch them"""
+    while True:
+        try:
+            job = wizzy.redis_client.blpop('wizzy:jobs', timeout=5)
+            if not job:
+                continue
+            update_data = orjson.loads(job[1])
+            # Dispatch to the pool so one slow Gemini call doesn't make
+            # every other queued update wait behind it
+            wizzy.io_pool.submit(wizzy.process_webhook, update_data)
+        except Exception as e:
+            logger.error(f"Error processing queued update: {e}")
+            time.sleep(1)
+
 # Background cleanup task
 def scheduled_cleanup():
     """Background task to cleanup old data every hour"""
@@ -698,45 +905,82 @@ def scheduled_cleanup():
             # Continue running even if cleanup fails
             time.sleep(3600)  # Wait 1 hour before retrying
 
+_background_tasks_started = threading.Event()
+
 def start_background_tasks():
-    """Start background cleanup tasks"""
+    """Start background cleanup and job queue tasks (idempotent)
+
+    Not called at import time: with gunicorn preload the module imports in
+    the master, and threads started there don't survive the fork into the
+    worker. The post_worker_init hook in gunicorn.conf.py calls this in
+    each worker; the dev server calls it from __main__.
+    """
+    if _background_tasks_started.is_set():
+        return
+    _background_tasks_started.set()
     cleanup_thread = threading.Thread(target=scheduled_cleanup, daemon=True)
     cleanup_thread.start()
-    logger.info("Background cleanup task started")
+    queue_thread = threading.Thread(target=process_job_queue, daemon=True)
+    queue_thread.start()
+    logger.info("Background cleanup and job queue tasks started")
 
 # Flask app setup
 app = Flask(__name__)
+app.json = OrJSONProvider(app)
 wizzy = WizzyBot()
 
-# Start background cleanup tasks
-start_background_tasks()
-
 @app.route('/webhook', methods=['POST'])
 def webhook():
     """Telegram webhook endpoint"""
     try:
         update_data = request.get_json()
-        wizzy.process_webhook(update_data)
-        return jsonify({'status': 'success'})
+
+        # Telegram retries updates that aren't acked within ~60s, which
+        # multiplies LLM cost; dedupe retries and ack fast instead
+        update_id = update_data.get('update_id') if update_data else None
+        try:
+            if update_id is not None and not wizzy.redis_client.set(
+                f"wizzy:upd:{update_id}", 1, nx=True, ex=300
+            ):
+                return app.response_class(orjson.dumps({'status': 'duplicate'}), mimetype='application/json')
+
+            # Enqueue for the background worker and return immediately
+            wizzy.redis_client.rpush('wizzy:jobs', orjson.dumps(update_data))
+        except redis.RedisError as e:
+            # Redis unavailable: fall back to inline processing
+            logger.error(f"Redis unavailable for webhook queue: {e}")
+            wizzy.process_webhook(update_data)
+
+        return app.response_class(orjson.dumps({'status': 'success'}), mimetype='application/json')
     except Exception as e:
         logger.error(f"Webhook error: {e}")
-        return jsonify({'status': 'error', 'message': str(e)}), 500
+        return app.response_class(
+            orjson.dumps({'status': 'error', 'message': str(e)}),
+            status=500,
+            mimetype='application/json'
+        )
 
 @app.route('/health', methods=['GET'])
 def health():
     """Health check endpoint"""
-    return jsonify({'status': 'healthy', 'service': 'Wizzy Bot'})
+    return app.response_class(
+        orjson.dumps({'status': 'healthy', 'service': 'Wizzy Bot'}),
+        mimetype='application/json'
+    )
 
 # Add production health check endpoint
 @app.route('/', methods=['GET'])
 def root():
     """Root endpoint for basic health check"""
-    return jsonify({
-        'status': 'healthy', 
-        'service': 'Wizzy Bot',
-        'version': '1.0.0',
-        'message': 'Bot is running successfully!'
-    })
+    return app.response_class(
+        orjson.dumps({
+            'status': 'healthy',
+            'service': 'Wizzy Bot',
+            'version': '1.0.0',
+            'message': 'Bot is running successfully!'
+        }),
+        mimetype='application/json'
+    )
 
 def setup_webhook():
     """Setup Telegram webhook"""
@@ -753,7 +997,7 @@ def setup_webhook():
         # Set webhook using requests to avoid async issues
         url = f"https://api.telegram.org/bot{wizzy.telegram_token}/setWebhook"
         data = {'url': webhook_url}
-        response = requests.post(url, json=data)
+        response = _post_json(wizzy.tg_session, url, data)
         response.raise_for_status()
         logger.info(f"Webhook set to: {webhook_url}")
         return True
@@ -764,7 +1008,8 @@ def setup_webhook():
 if __name__ == '__main__':
     # Setup webhook
     setup_webhook()
-    
+    start_background_tasks()
+
     # Run Flask app
     port = int(os.getenv('PORT', 8000))
     debug_mode = os.getenv('ENVIRONMENT') == 'development'
@@ -1,13 +1,24 @@
 # Gunicorn configuration for Render deployment
+# Monkey-patch before anything else imports sockets so requests/redis
+# become cooperative under the gevent worker
+import gevent.monkey
+gevent.monkey.patch_all()
+
 import os
 
+# psycopg2 is a C extension whose sockets bypass the monkey patch; it needs
+# its own wait callback or every Postgres call blocks the event loop
+if os.getenv('DATABASE_URL', '').startswith(('postgres://', 'postgresql://')):
+    from psycogreen.gevent import patch_psycopg
+    patch_psycopg()
+
 # Server socket
 bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
 backlog = 2048
 
 # Worker processes
 workers = 1  # Render free tier has limited memory
-worker_class = "sync"
+worker_class = "gevent"  # Cooperative I/O so slow LLM calls don't stall other webhooks
 worker_connections = 1000
 timeout = 120
 keepalive = 10
@@ -31,3 +42,13 @@ preload_app = True
 # Enable auto-reload in development
 if os.getenv('ENVIRONMENT') == 'development':
     reload = True
+
+def post_worker_init(worker):
+    """Start the queue consumer and cleanup threads inside each worker
+
+    With preload_app the module imports in the master before fork, and
+    threads started at import don't survive into the worker — which would
+    leave the process serving webhooks with no wizzy:jobs consumer.
+    """
+    from app import start_background_tasks
+    start_background_tasks()
@@ -1,10 +1,12 @@
 """
 Database models for Wizzy Bot persistent storage
 """
-from sqlalchemy import create_engine, Column, String, Text, DateTime, Integer, JSON
+from sqlalchemy import create_engine, Column, String, Text, DateTime, Integer, JSON, Index, event, func
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from datetime import datetime
+from sqlalchemy.orm import sessionmaker, scoped_session, deferred
+from sqlalchemy.pool import QueuePool
+from contextlib import contextmanager
+from functools import lru_cache
 import os
 
 Base = declarative_base()
@@ -12,27 +14,39 @@ Base = declarative_base()
 class ChatHistory(Base):
     """Store conversation messages for each chat session"""
     __tablename__ = 'chat_history'
-    
+
     id = Column(Integer, primary_key=True, autoincrement=True)
     session_id = Column(String(50), nullable=False, index=True)
     message_type = Column(String(20), nullable=False)  # 'human' or 'ai'
     content = Column(Text, nullable=False)
-    timestamp = Column(DateTime, default=datetime.utcnow)
-    message_metadata = Column(JSON, default={})  # For additional message metadata
+    timestamp = Column(DateTime, server_default=func.now(), index=True)  # Scanned by the periodic cleanup DELETE
+    message_metadata = Column(JSON, default=dict)  # For additional message metadata
+
+    # Serves "last N messages for session X" (ORDER BY timestamp DESC
+    # LIMIT 20) as a forward index range scan
+    __table_args__ = (
+        Index('ix_chat_history_session_timestamp', session_id, timestamp.desc()),
+    )
 
 class DocumentContext(Base):
     """Store uploaded documents and their content"""
     __tablename__ = 'document_contexts'
     
     id = Column(Integer, primary_key=True, autoincrement=True)
-    session_id = Column(String(50), nullable=False, index=True)
+    # One document per session; the unique index backs the store UPSERT
+    session_id = Column(String(50), unique=True, nullable=False, index=True)
     filename = Column(String(255), nullable=False)
-    content = Column(Text, nullable=False)
+    # Deferred: the LOB is only fetched when .content is actually accessed
+    content = deferred(Column(Text, nullable=False))
     summary = Column(Text)
     file_type = Column(String(20))
     file_size = Column(Integer)
-    uploaded_at = Column(DateTime, default=datetime.utcnow)
-    file_metadata = Column(JSON, default={})
+    uploaded_at = Column(DateTime, server_default=func.now())
+    file_metadata = Column(JSON, default=dict)
+
+    __table_args__ = (
+        Index('ix_document_contexts_session_uploaded', 'session_id', 'uploaded_at'),
+    )
 
 class UserSession(Base):
     """Store user session information"""
@@ -41,38 +55,84 @@ class UserSession(Base):
     id = Column(Integer, primary_key=True, autoincrement=True)
     session_id = Column(String(50), unique=True, nullable=False, index=True)
     user_name = Column(String(100))
-    first_interaction = Column(DateTime, default=datetime.utcnow)
-    last_interaction = Column(DateTime, default=datetime.utcnow)
+    first_interaction = Column(DateTime, server_default=func.now())
+    last_interaction = Column(DateTime, server_default=func.now())
     total_messages = Column(Integer, default=0)
-    preferences = Column(JSON, default={})
+    preferences = Column(JSON, default=dict)
 
 # Database connection and session management
 class DatabaseManager:
     def __init__(self, database_url: str):
-        self.engine = create_engine(database_url)
-        self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
-        
+        # Larger compiled-statement cache: the app re-issues the same
+        # handful of queries with different parameters
+        engine_kwargs = {'query_cache_size': 1200}
+        if database_url.startswith('postgresql'):
+            # Pool physical connections so queries don't pay TCP/SSL setup;
+            # psycopg2 batched executemany makes multi-row inserts one
+            # round-trip instead of one per row
+            engine_kwargs.update(
+                poolclass=QueuePool,
+                pool_size=10,
+                max_overflow=20,
+                pool_pre_ping=True,
+                pool_recycle=3600,
+                executemany_mode='values_plus_batch',
+                executemany_batch_page_size=500,
+                insertmanyvalues_page_size=500
+            )
+        elif database_url.startswith('sqlite'):
+            # Sessions are shared across worker threads
+            engine_kwargs.update(connect_args={'check_same_thread': False})
+        self.engine = create_engine(database_url, **engine_kwargs)
+
+        if database_url.startswith('sqlite'):
+            # WAL + NORMAL sync: one fsync per checkpoint instead of per
+            # commit, and readers no longer block behind the writer
+            @event.listens_for(self.engine, 'connect')
+            def _set_sqlite_pragmas(dbapi_connection, connection_record):
+                cursor = dbapi_connection.cursor()
+                cursor.execute("PRAGMA journal_mode=WAL")
+                cursor.execute("PRAGMA synchronous=NORMAL")
+                cursor.execute("PRAGMA wal_autocheckpoint=1000")
+                cursor.execute("PRAGMA temp_store=MEMORY")
+                cursor.close()
+
+        self.SessionLocal = scoped_session(
+            sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+        )
+
     def create_tables(self):
         """Create all tables if they don't exist"""
         Base.metadata.create_all(bind=self.engine)
-        
+
     def get_session(self):
         """Get a database session"""
         return self.SessionLocal()
-        
+
     def close_session(self, session):
-        """Close a database session"""
-        session.close()
+        """Return the scoped session's connection to the pool"""
+        self.SessionLocal.remove()
 
 # Initialize database manager
+@lru_cache(maxsize=1)
 def get_database_manager():
-    """Get database manager instance"""
+    """Get the shared database manager instance"""
     database_url = os.getenv('DATABASE_URL', 'sqlite:///wizzy_bot.db')
-    
+
     # Handle Heroku DATABASE_URL format
     if database_url.startswith('postgres://'):
         database_url = database_url.replace('postgres://', 'postgresql://', 1)
-    
+
     db_manager = DatabaseManager(database_url)
     db_manager.create_tables()
     return db_manager
+
+@contextmanager
+def db_session():
+    """Yield a pooled database session, releasing it on exit"""
+    db_manager = get_database_manager()
+    session = db_manager.get_session()
+    try:
+        yield session
+    finally:
+        db_manager.close_session(session)
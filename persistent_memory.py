@@ -1,199 +1,527 @@
 """
 Database-backed persistent memory implementation for Wizzy Bot
 """
-from typing import List, Optional
+from collections import deque
+from concurrent.futures import Future
+from typing import Dict, List, Optional
 from langchain_core.chat_history import BaseChatMessageHistory
 from langchain_core.messages import BaseMessage, HumanMessage, AIMessage
-from models import ChatHistory, DocumentContext, UserSession, get_database_manager
+from models import ChatHistory, DocumentContext, UserSession, db_session
 from datetime import datetime, timedelta
-from sqlalchemy import desc
+from sqlalchemy import desc, func, text
+import asyncio
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+import atexit
 import logging
+import os
+import queue
+import threading
+import time
+import orjson
+import redis
+import zstandard
+from cachetools import TTLCache
 
 logger = logging.getLogger(__name__)
 
+# Write-behind batching: how many rows per bulk insert, and how long to
+# wait for more rows before flushing a partial batch
+BULK_MAX = 500
+FLUSH_TIMEOUT_MS = 100
+
+class _WriteBehindWorker:
+    """Background writer that batches chat-history inserts
+
+    add_message() only enqueues; this worker drains the queue and issues one
+    multi-row INSERT plus one UserSession counter UPDATE per touched session,
+    amortizing commit fsyncs across the batch.
+    """
+
+    def __init__(self):
+        self.queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def enqueue(self, session_id: str, message_type: str, content: str, timestamp):
+        self._ensure_thread()
+        self.queue.put((session_id, message_type, content, timestamp))
+
+    def submit(self, fn) -> Future:
+        """Run an arbitrary write callable on the single writer thread
+
+        Serializing every DB mutation through one thread means writers
+        never contend for the SQLite file lock; callers wait on the
+        returned Future when they need the result.
+        """
+        self._ensure_thread()
+        future = Future()
+        self.queue.put((fn, future))
+        return future
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                # Message tuples have 4 fields; submitted jobs are
+                # (callable, Future) pairs
+                item = self.queue.get()
+                if len(item) == 2:
+                    self._run_job(*item)
+                    continue
+                items = [item]
+                pending_job = None
+                # Short flush window so bursts group into one batch
+                deadline = time.monotonic() + FLUSH_TIMEOUT_MS / 1000
+                while len(items) < BULK_MAX:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        nxt = self.queue.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                    if len(nxt) == 2:
+                        pending_job = nxt
+                        break
+                    items.append(nxt)
+                self._flush_items(items)
+                if pending_job is not None:
+                    self._run_job(*pending_job)
+            except Exception as e:
+                logger.error(f"Error in write-behind worker: {e}")
+                time.sleep(1)
+
+    def _run_job(self, fn, future):
+        try:
+            future.set_result(fn())
+        except Exception as e:
+            future.set_exception(e)
+
+    def _flush_items(self, items):
+        if not items:
+            return
+        try:
+            with db_session() as session:
+                # Chat-log batches tolerate losing the last few ms of WAL on
+                # a crash; skip the synchronous flush for this txn only
+                if session.get_bind().dialect.name == 'postgresql':
+                    session.execute(text("SET LOCAL synchronous_commit = off"))
+                counts = {}
+                for session_id, _, _, _ in items:
+                    counts[session_id] = counts.get(session_id, 0) + 1
+
+                # Expired-message cleanup is handled by the hourly
+                # scheduled_cleanup task, not on the write path
+                session.bulk_insert_mappings(ChatHistory, [
+                    {
+                        'session_id': session_id,
+                        'message_type': message_type,
+                        'content': content,
+                        'timestamp': timestamp
+                    }
+                    for session_id, message_type, content, timestamp in items
+                ])
+
+                # Update per-session statistics in one UPDATE per touched session
+                for session_id, count in counts.items():
+                    session.query(UserSession).filter(
+                        UserSession.session_id == session_id
+                    ).update(
+                        {
+                            # Server-side clock; nothing shipped from Python
+                            UserSession.last_interaction: func.now(),
+                            UserSession.total_messages: UserSession.total_messages + count
+                        },
+                        synchronize_session=False
+                    )
+                # One commit (one fsync) covers cleanup, inserts and counters
+                session.commit()
+        except Exception as e:
+            logger.error(f"Error flushing chat history batch: {e}")
+
+    def flush(self):
+        """Synchronously drain everything still queued (used at shutdown)"""
+        while True:
+            items = []
+            jobs = []
+            while len(items) < BULK_MAX:
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if len(item) == 2:
+                    jobs.append(item)
+                else:
+                    items.append(item)
+            if not items and not jobs:
+                break
+            self._flush_items(items)
+            for fn, future in jobs:
+                self._run_job(fn, future)
+
+_write_worker = _WriteBehindWorker()
+atexit.register(_write_worker.flush)
+
+# How long cached documents live in Redis (matches the 7-day DB cleanup)
+DOCUMENT_CACHE_TTL = 7 * 86400
+
+# Per-process hot cache in front of Redis/DB; short TTL keeps workers
+# roughly in sync, store/delete invalidate eagerly within this process
+_document_cache = TTLCache(maxsize=1024, ttl=60)
+
+_redis_client = None
+
+def get_redis_client():
+    """Get a shared Redis client (best-effort; callers handle failures)"""
+    global _redis_client
+    if _redis_client is None:
+        _redis_client = redis.from_url(os.getenv('REDIS_URL', 'redis://localhost:6379'))
+    return _redis_client
+
+# Type-dispatch table for add_message; a dict hit beats an isinstance chain
+_MSG_TYPE = {HumanMessage: 'human', AIMessage: 'ai'}
+
+# Single-flight bookkeeping: concurrent loads of the same session share
+# one DB query instead of issuing duplicates
+_INFLIGHT: Dict[str, Future] = {}
+_inflight_lock = threading.Lock()
+
+# How long the Redis history mirror lives without activity
+HISTORY_CACHE_TTL = 3600
+
 class DatabaseChatMessageHistory(BaseChatMessageHistory):
     """Database-backed chat message history implementation"""
     
     def __init__(self, session_id: str):
         self.session_id = session_id
-        self.db_manager = get_database_manager()
         self._messages = None
-        
+        # Instances are shared across request threads via get_history
+        self._cache_lock = threading.RLock()
+
     @property
     def messages(self) -> List[BaseMessage]:
         """Retrieve messages from database"""
-        if self._messages is None:
-            self._load_messages()
-        return self._messages
-    
-    def _load_messages(self):
-        """Load messages from database (latest 20 messages only)"""
-        session = self.db_manager.get_session()
+        with self._cache_lock:
+            if self._messages is None:
+                self._load_messages()
+            return list(self._messages)
+
+    def get_recent(self, n: int) -> List[BaseMessage]:
+        """Return only the latest n messages, fetching just that window
+
+        When the cache is cold this queries LIMIT n instead of the full
+        20-message window, so callers that need a short tail (e.g.
+        summarization) transfer proportionally less.
+        """
+        with self._cache_lock:
+            if self._messages is not None:
+                return list(self._messages)[-n:]
+        return self._fetch_window(n)
+
+    def _fetch_window(self, limit: int) -> List[BaseMessage]:
+        """Fetch the latest `limit` messages in chronological order"""
         try:
-            # Get only the latest 20 messages for this session
-            chat_records = session.query(ChatHistory).filter(
-                ChatHistory.session_id == self.session_id
-            ).order_by(desc(ChatHistory.timestamp)).limit(20).all()
-            
-            # Reverse to get chronological order (oldest first)
-            chat_records.reverse()
-            
-            self._messages = []
-            for record in chat_records:
-                if record.message_type == 'human':
-                    message = HumanMessage(content=record.content)
-                elif record.message_type == 'ai':
-                    message = AIMessage(content=record.content)
-                else:
-                    continue  # Skip unknown message types
-                self._messages.append(message)
-                
+            with db_session() as session:
+                rows = session.query(
+                    ChatHistory.message_type, ChatHistory.content
+                ).filter(
+                    ChatHistory.session_id == self.session_id
+                ).order_by(desc(ChatHistory.timestamp)).limit(limit).all()
         except Exception as e:
             logger.error(f"Error loading messages: {e}")
-            self._messages = []
-        finally:
-            self.db_manager.close_session(session)
-    
-    def add_message(self, message: BaseMessage) -> None:
-        """Add a message to the database"""
-        session = self.db_manager.get_session()
+            return []
+
+        rows.reverse()
+        messages = []
+        for message_type, content in rows:
+            if message_type == 'human':
+                messages.append(HumanMessage(content=content))
+            elif message_type == 'ai':
+                messages.append(AIMessage(content=content))
+        return messages
+
+    def _load_messages(self):
+        """Load messages from database (latest 20 messages only)
+
+        Uses single-flight per session_id: the first caller runs the query
+        and any concurrent callers wait on its Future rather than hitting
+        the database themselves.
+        """
+        mirrored = self._load_from_mirror()
+        if mirrored is not None:
+            self._messages = deque(mirrored, maxlen=20)
+            return
+
+        with _inflight_lock:
+            future = _INFLIGHT.get(self.session_id)
+            is_owner = future is None
+            if is_owner:
+                future = Future()
+                _INFLIGHT[self.session_id] = future
+
+        if is_owner:
+            try:
+                messages = self._fetch_window(20)
+                self._repopulate_mirror(messages)
+                future.set_result(messages)
+            finally:
+                with _inflight_lock:
+                    _INFLIGHT.pop(self.session_id, None)
+
+        self._messages = deque(future.result(), maxlen=20)
+
+    def _history_key(self) -> str:
+        return f"wizzy:sess:{self.session_id}:hist"
+
+    def _load_from_mirror(self) -> Optional[List[BaseMessage]]:
+        """Read the hot history list from Redis; None means mirror miss"""
         try:
-            # Auto-cleanup old messages before adding new one
-            self._cleanup_old_messages(session)
-            
-            # Determine message type
-            if isinstance(message, HumanMessage):
-                message_type = 'human'
-            elif isinstance(message, AIMessage):
-                message_type = 'ai'
-            else:
-                message_type = 'system'
-            
-            # Create chat history record
-            chat_record = ChatHistory(
-                session_id=self.session_id,
-                message_type=message_type,
-                content=message.content,
-                timestamp=datetime.utcnow()
-            )
-            
-            session.add(chat_record)
-            session.commit()
-            
-            # Update in-memory cache
-            if self._messages is not None:
-                self._messages.append(message)
-                # Keep only latest 20 in memory cache
-                if len(self._messages) > 20:
-                    self._messages = self._messages[-20:]
-                
-            # Update user session stats
-            self._update_user_session(session)
-            
+            raw = get_redis_client().lrange(self._history_key(), 0, -1)
         except Exception as e:
-            logger.error(f"Error adding message: {e}")
-            session.rollback()
-        finally:
-            self.db_manager.close_session(session)
-    
-    def _cleanup_old_messages(self, session):
-        """Auto-delete messages older than 1 day for this session"""
+            logger.error(f"Error reading history mirror: {e}")
+            return None
+        if not raw:
+            return None
+
+        messages = []
+        for blob in raw:
+            entry = orjson.loads(blob)
+            if entry['type'] == 'human':
+                messages.append(HumanMessage(content=entry['content']))
+            elif entry['type'] == 'ai':
+                messages.append(AIMessage(content=entry['content']))
+        return messages
+
+    def _repopulate_mirror(self, messages: List[BaseMessage]) -> None:
+        """Rebuild the Redis mirror after a cold DB load"""
+        if not messages:
+            return
         try:
-            # Calculate cutoff time (1 day ago)
-            cutoff_time = datetime.utcnow() - timedelta(days=1)
-            
-            # Delete messages older than 1 day for this session
-            deleted_count = session.query(ChatHistory).filter(
-                ChatHistory.session_id == self.session_id,
-                ChatHistory.timestamp < cutoff_time
-            ).delete()
-            
-            if deleted_count > 0:
-                logger.info(f"Auto-deleted {deleted_count} old messages for session {self.session_id}")
-            
-            session.commit()
+            pipe = get_redis_client().pipeline()
+            pipe.delete(self._history_key())
+            pipe.rpush(self._history_key(), *[
+                orjson.dumps({'type': _MSG_TYPE.get(type(m), 'system'), 'content': m.content})
+                for m in messages
+            ])
+            pipe.expire(self._history_key(), HISTORY_CACHE_TTL)
+            pipe.execute()
         except Exception as e:
-            logger.error(f"Error cleaning up old messages: {e}")
+            logger.error(f"Error repopulating history mirror: {e}")
     
-    def _update_user_session(self, session):
-        """Update user session statistics"""
+    def add_message(self, message: BaseMessage) -> None:
+        """Queue a message for write-behind insertion into the database"""
         try:
-            user_session = session.query(UserSession).filter(
-                UserSession.session_id == self.session_id
-            ).first()
-            
-            if user_session:
-                user_session.last_interaction = datetime.utcnow()
-                user_session.total_messages += 1
-            
-            session.commit()
+            # Determine message type
+            message_type = _MSG_TYPE.get(type(message), 'system')
+
+            # Enqueue for the background writer; cleanup and the user-session
+            # counter update happen there, batched per flush
+            _write_worker.enqueue(
+                self.session_id, message_type, message.content, datetime.utcnow()
+            )
+
+            # Mirror into Redis so other workers' cold loads skip the DB
+            try:
+                pipe = get_redis_client().pipeline()
+                pipe.rpush(self._history_key(), orjson.dumps(
+                    {'type': message_type, 'content': message.content}
+                ))
+                pipe.ltrim(self._history_key(), -20, -1)
+                pipe.expire(self._history_key(), HISTORY_CACHE_TTL)
+                pipe.execute()
+            except Exception as e:
+                logger.error(f"Error mirroring message to Redis: {e}")
+
+            # Update in-memory cache; the deque drops the oldest entry
+            # once 20 messages are held
+            with self._cache_lock:
+                if self._messages is not None:
+                    self._messages.append(message)
+
         except Exception as e:
-            logger.error(f"Error updating user session: {e}")
-    
+            logger.error(f"Error adding message: {e}")
+
+    async def aget_messages(self) -> List[BaseMessage]:
+        """Async message access; runs the blocking DB read off the event loop"""
+        return await asyncio.to_thread(lambda: self.messages)
+
+    async def aadd_messages(self, messages: List[BaseMessage]) -> None:
+        """Async counterpart of add_messages"""
+        await asyncio.to_thread(self.add_messages, messages)
+
+    async def aclear(self) -> None:
+        """Async counterpart of clear"""
+        await asyncio.to_thread(self.clear)
+
     def clear(self) -> None:
         """Clear all messages from database"""
-        session = self.db_manager.get_session()
+        def _delete():
+            with db_session() as session:
+                session.query(ChatHistory).filter(
+                    ChatHistory.session_id == self.session_id
+                ).delete(synchronize_session=False)
+                session.commit()
+
         try:
-            session.query(ChatHistory).filter(
-                ChatHistory.session_id == self.session_id
-            ).delete()
-            session.commit()
-            self._messages = []
+            _write_worker.submit(_delete).result()
+            try:
+                get_redis_client().delete(self._history_key())
+            except Exception as e:
+                logger.error(f"Error clearing history mirror: {e}")
+            with self._cache_lock:
+                self._messages = deque(maxlen=20)
+            # Drop the shared instance so the next turn starts fresh
+            with _history_cache_lock:
+                _HISTORY_CACHE.pop(self.session_id, None)
         except Exception as e:
             logger.error(f"Error clearing messages: {e}")
-            session.rollback()
-        finally:
-            self.db_manager.close_session(session)
+
+# Shared history instances so repeat turns within the TTL window reuse an
+# already-loaded message deque instead of re-querying the database
+_HISTORY_CACHE = TTLCache(maxsize=2048, ttl=300)
+_history_cache_lock = threading.Lock()
+
+def get_history(session_id: str) -> DatabaseChatMessageHistory:
+    """Get or create the shared chat history for a session"""
+    with _history_cache_lock:
+        history = _HISTORY_CACHE.get(session_id)
+        if history is None:
+            history = DatabaseChatMessageHistory(session_id)
+            _HISTORY_CACHE[session_id] = history
+        return history
 
 class DatabaseDocumentManager:
-    """Manage document contexts in database"""
-    
-    def __init__(self):
-        self.db_manager = get_database_manager()
-    
+    """Manage document contexts in database with a Redis hot cache"""
+
+    def _cache_document(self, session_id: str, doc: dict):
+        """Mirror a document into Redis so workers share one hot copy"""
+        try:
+            r = get_redis_client()
+            meta = {k: v for k, v in doc.items() if k != 'content' and v is not None}
+            pipe = r.pipeline()
+            pipe.delete(f"wizzy:doc:{session_id}:meta")
+            pipe.hset(f"wizzy:doc:{session_id}:meta", mapping=meta)
+            # zstd level 3 typically shrinks extracted text 3-10x
+            compressed = zstandard.ZstdCompressor(level=3).compress(doc['content'].encode())
+            pipe.set(f"wizzy:doc:{session_id}:content", compressed)
+            pipe.expire(f"wizzy:doc:{session_id}:meta", DOCUMENT_CACHE_TTL)
+            pipe.expire(f"wizzy:doc:{session_id}:content", DOCUMENT_CACHE_TTL)
+            pipe.execute()
+        except Exception as e:
+            logger.error(f"Error caching document in Redis: {e}")
+
+    def _get_cached_document(self, session_id: str) -> Optional[dict]:
+        """Fetch a document from the Redis cache, if present"""
+        try:
+            r = get_redis_client()
+            meta = r.hgetall(f"wizzy:doc:{session_id}:meta")
+            if not meta:
+                return None
+            content = r.get(f"wizzy:doc:{session_id}:content")
+            if content is None:
+                return None
+            doc = {key.decode(): value.decode() for key, value in meta.items()}
+            if 'file_size' in doc:
+                doc['file_size'] = int(doc['file_size'])
+            doc['content'] = zstandard.ZstdDecompressor().decompress(content).decode()
+            return doc
+        except Exception as e:
+            logger.error(f"Error reading document cache: {e}")
+            return None
+
+    def _get_cached_metadata(self, session_id: str) -> Optional[dict]:
+        """Fetch document metadata (no content) from the Redis cache"""
+        try:
+            r = get_redis_client()
+            meta = r.hgetall(f"wizzy:doc:{session_id}:meta")
+            if not meta:
+                return None
+            doc = {key.decode(): value.decode() for key, value in meta.items()}
+            if 'file_size' in doc:
+                doc['file_size'] = int(doc['file_size'])
+            return doc
+        except Exception as e:
+            logger.error(f"Error reading document cache: {e}")
+            return None
+
+    def _evict_cached_document(self, session_id: str):
+        """Drop a document from the Redis cache"""
+        try:
+            r = get_redis_client()
+            r.delete(f"wizzy:doc:{session_id}:meta", f"wizzy:doc:{session_id}:content")
+        except Exception as e:
+            logger.error(f"Error evicting document cache: {e}")
+
     def store_document(self, session_id: str, filename: str, content: str, 
                       summary: str, file_type: str, file_size: int) -> bool:
         """Store document in database"""
-        session = self.db_manager.get_session()
         try:
-            # Remove existing document for this session (one document per session)
-            session.query(DocumentContext).filter(
-                DocumentContext.session_id == session_id
-            ).delete()
-            
-            # Add new document
-            doc_context = DocumentContext(
-                session_id=session_id,
-                filename=filename,
-                content=content,
-                summary=summary,
-                file_type=file_type,
-                file_size=file_size,
-                uploaded_at=datetime.utcnow()
-            )
-            
-            session.add(doc_context)
-            session.commit()
+            now = datetime.utcnow()
+            values = {
+                'filename': filename,
+                'content': content,
+                'summary': summary,
+                'file_type': file_type,
+                'file_size': file_size,
+                'uploaded_at': now
+            }
+            def _write():
+                with db_session() as session:
+                    # One atomic UPSERT replaces the old DELETE+INSERT pair;
+                    # the unique session_id index enforces one doc per session
+                    insert_fn = pg_insert if session.get_bind().dialect.name == 'postgresql' else sqlite_insert
+                    stmt = insert_fn(DocumentContext).values(session_id=session_id, **values)
+                    stmt = stmt.on_conflict_do_update(index_elements=['session_id'], set_=values)
+                    session.execute(stmt)
+                    session.commit()
+
+            _write_worker.submit(_write).result()
+            _document_cache.pop(session_id, None)
             logger.info(f"Document {filename} stored for session {session_id}")
+
+            # Mirror into Redis so subsequent reads skip the database
+            self._cache_document(session_id, {
+                'filename': filename,
+                'content': content,
+                'summary': summary,
+                'file_type': file_type,
+                'file_size': file_size,
+                'uploaded_at': now.isoformat()
+            })
             return True
-            
+
         except Exception as e:
             logger.error(f"Error storing document: {e}")
-            session.rollback()
             return False
-        finally:
-            self.db_manager.close_session(session)
     
     def get_document(self, session_id: str) -> Optional[dict]:
-        """Retrieve document context for session"""
-        session = self.db_manager.get_session()
+        """Retrieve document context for session (in-process, Redis, then database)"""
+        doc = _document_cache.get(session_id)
+        if doc is not None:
+            return doc
+
+        cached = self._get_cached_document(session_id)
+        if cached:
+            _document_cache[session_id] = cached
+            return cached
+
         try:
-            doc_context = session.query(DocumentContext).filter(
-                DocumentContext.session_id == session_id
-            ).first()
-            
-            if doc_context:
-                return {
+            with db_session() as session:
+                doc_context = session.query(DocumentContext).filter(
+                    DocumentContext.session_id == session_id
+                ).first()
+
+                if doc_context is None:
+                    return None
+
+                doc = {
                     'filename': doc_context.filename,
                     'content': doc_context.content,
                     'summary': doc_context.summary,
@@ -201,122 +529,174 @@ class DatabaseDocumentManager:
                     'file_size': doc_context.file_size,
                     'uploaded_at': doc_context.uploaded_at.isoformat()
                 }
-            return None
-            
+
+            self._cache_document(session_id, doc)
+            _document_cache[session_id] = doc
+            return doc
+
         except Exception as e:
             logger.error(f"Error retrieving document: {e}")
             return None
-        finally:
-            self.db_manager.close_session(session)
     
+    def get_document_metadata(self, session_id: str) -> Optional[dict]:
+        """Retrieve document metadata without pulling the content LOB"""
+        doc = _document_cache.get(session_id)
+        if doc is not None:
+            return {k: v for k, v in doc.items() if k != 'content'}
+
+        cached = self._get_cached_metadata(session_id)
+        if cached:
+            return cached
+
+        try:
+            with db_session() as session:
+                row = session.query(
+                    DocumentContext.filename,
+                    DocumentContext.summary,
+                    DocumentContext.file_type,
+                    DocumentContext.file_size,
+                    DocumentContext.uploaded_at
+                ).filter(
+                    DocumentContext.session_id == session_id
+                ).first()
+
+            if row is None:
+                return None
+
+            return {
+                'filename': row.filename,
+                'summary': row.summary,
+                'file_type': row.file_type,
+                'file_size': row.file_size,
+                'uploaded_at': row.uploaded_at.isoformat()
+            }
+
+        except Exception as e:
+            logger.error(f"Error retrieving document metadata: {e}")
+            return None
+
+    def get_document_content(self, session_id: str) -> Optional[str]:
+        """Retrieve just the document text, for feeding the model"""
+        doc = self.get_document(session_id)
+        return doc['content'] if doc else None
+
     def delete_document(self, session_id: str) -> bool:
         """Delete document context for session"""
-        session = self.db_manager.get_session()
+        _document_cache.pop(session_id, None)
+        self._evict_cached_document(session_id)
+
+        def _delete():
+            with db_session() as session:
+                session.query(DocumentContext).filter(
+                    DocumentContext.session_id == session_id
+                ).delete(synchronize_session=False)
+                session.commit()
+
         try:
-            session.query(DocumentContext).filter(
-                DocumentContext.session_id == session_id
-            ).delete()
-            session.commit()
+            _write_worker.submit(_delete).result()
             return True
         except Exception as e:
             logger.error(f"Error deleting document: {e}")
-            session.rollback()
             return False
-        finally:
-            self.db_manager.close_session(session)
 
 class UserSessionManager:
     """Manage user sessions in database"""
-    
-    def __init__(self):
-        self.db_manager = get_database_manager()
-    
+
     def create_or_update_session(self, session_id: str, user_name: str = None):
-        """Create or update user session"""
-        session = self.db_manager.get_session()
+        """Create or update user session in one UPSERT round-trip
+
+        Fire-and-forget: the upsert runs on the single writer thread and
+        the caller doesn't wait for it.
+        """
+        _write_worker.submit(lambda: self._upsert(session_id, user_name))
+
+    def _upsert(self, session_id: str, user_name: str = None):
         try:
-            user_session = session.query(UserSession).filter(
-                UserSession.session_id == session_id
-            ).first()
-            
-            if user_session:
-                # Update existing session
-                user_session.last_interaction = datetime.utcnow()
-                if user_name and not user_session.user_name:
-                    user_session.user_name = user_name
-            else:
-                # Create new session
-                user_session = UserSession(
+            with db_session() as session:
+                # Single INSERT ... ON CONFLICT DO UPDATE; no SELECT-then-
+                # UPDATE race between concurrent webhook workers
+                insert_fn = pg_insert if session.get_bind().dialect.name == 'postgresql' else sqlite_insert
+                stmt = insert_fn(UserSession).values(
                     session_id=session_id,
                     user_name=user_name,
-                    first_interaction=datetime.utcnow(),
-                    last_interaction=datetime.utcnow(),
+                    first_interaction=func.now(),
+                    last_interaction=func.now(),
                     total_messages=0
                 )
-                session.add(user_session)
-            
-            session.commit()
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=['session_id'],
+                    set_={
+                        'last_interaction': func.now(),
+                        # Keep the first name we ever saw for the session
+                        'user_name': func.coalesce(UserSession.user_name, stmt.excluded.user_name)
+                    }
+                )
+                session.execute(stmt)
+                session.commit()
         except Exception as e:
             logger.error(f"Error managing user session: {e}")
-            session.rollback()
-        finally:
-            self.db_manager.close_session(session)
 
 
 # Global cleanup functions
+
+# Rows deleted per cleanup transaction; bounds lock time and WAL per commit
+CLEANUP_CHUNK_SIZE = 5000
+
 def cleanup_all_old_messages():
     """Cleanup old messages across all sessions (useful for scheduled cleanup)"""
     try:
-        db_manager = get_database_manager()
-        session = db_manager.get_session()
-        
         # Calculate cutoff time (1 day ago)
         cutoff_time = datetime.utcnow() - timedelta(days=1)
-        
-        # Delete all messages older than 1 day across all sessions
-        deleted_count = session.query(ChatHistory).filter(
-            ChatHistory.timestamp < cutoff_time
-        ).delete()
-        
-        session.commit()
-        
+        deleted_count = 0
+
+        with db_session() as session:
+            # Delete in bounded chunks, committing between them, so the
+            # cleaner never holds the table against live chat writes
+            row_id = 'ctid' if session.get_bind().dialect.name == 'postgresql' else 'rowid'
+            stmt = text(
+                f"DELETE FROM chat_history WHERE {row_id} IN "
+                f"(SELECT {row_id} FROM chat_history WHERE timestamp < :cutoff LIMIT :chunk)"
+            )
+            while True:
+                n = session.execute(
+                    stmt, {'cutoff': cutoff_time, 'chunk': CLEANUP_CHUNK_SIZE}
+                ).rowcount
+                session.commit()
+                deleted_count += n
+                if n < CLEANUP_CHUNK_SIZE:
+                    break
+                # Brief pause so interleaved inserts get the lock
+                time.sleep(0.05)
+
         if deleted_count > 0:
             logger.info(f"Global cleanup: Deleted {deleted_count} old messages across all sessions")
-        
+
         return deleted_count
-        
+
     except Exception as e:
         logger.error(f"Error in global cleanup: {e}")
-        session.rollback()
         return 0
-    finally:
-        db_manager.close_session(session)
 
 
 def cleanup_old_documents(days: int = 7):
     """Cleanup old documents (default: 7 days)"""
     try:
-        db_manager = get_database_manager()
-        session = db_manager.get_session()
-        
-        # Calculate cutoff time
-        cutoff_time = datetime.utcnow() - timedelta(days=days)
-        
-        # Delete old documents
-        deleted_count = session.query(DocumentContext).filter(
-            DocumentContext.uploaded_at < cutoff_time
-        ).delete()
-        
-        session.commit()
-        
+        with db_session() as session:
+            # Calculate cutoff time
+            cutoff_time = datetime.utcnow() - timedelta(days=days)
+
+            # Delete old documents
+            deleted_count = session.query(DocumentContext).filter(
+                DocumentContext.uploaded_at < cutoff_time
+            ).delete(synchronize_session=False)
+
+            session.commit()
+
         if deleted_count > 0:
             logger.info(f"Document cleanup: Deleted {deleted_count} old documents older than {days} days")
-        
+
         return deleted_count
-        
+
     except Exception as e:
         logger.error(f"Error in document cleanup: {e}")
-        session.rollback()
         return 0
-    finally:
-        db_manager.close_session(session)
@@ -0,0 +1,138 @@
+"""
+Redis-backed semantic response cache for Wizzy Bot
+Skips a full Gemini round-trip when a similar prompt was answered recently
+"""
+import hashlib
+import logging
+from array import array
+from math import sqrt
+from typing import List, Optional, Tuple
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+# Gemini embedding model used for similarity lookups
+EMBEDDING_MODEL = "text-embedding-004"
+EMBEDDING_URL = f"https://generativelanguage.googleapis.com/v1beta/models/{EMBEDDING_MODEL}:embedContent"
+
+
+class SemanticResponseCache:
+    """Cache chat responses in Redis keyed by prompt embedding similarity"""
+
+    def __init__(self, redis_client, google_api_key: str, session: Optional[requests.Session] = None,
+                 similarity_threshold: float = 0.90, ttl: int = 86400, max_entries: int = 200):
+        self.redis_client = redis_client
+        self.google_api_key = google_api_key
+        self.session = session or requests.Session()
+        self.similarity_threshold = similarity_threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+    def _embed(self, text: str) -> Optional[List[float]]:
+        """Embed text using the Gemini embedContent API"""
+        try:
+            payload = {
+                "model": f"models/{EMBEDDING_MODEL}",
+                "content": {"parts": [{"text": text}]}
+            }
+            response = self.session.post(
+                f"{EMBEDDING_URL}?key={self.google_api_key}",
+                json=payload,
+                timeout=10
+            )
+            response.raise_for_status()
+            return response.json()["embedding"]["values"]
+        except Exception as e:
+            logger.error(f"Error embedding text for cache: {e}")
+            return None
+
+    @staticmethod
+    def _cosine_similarity(a, b) -> float:
+        """Cosine similarity between two equal-length vectors"""
+        dot = 0.0
+        norm_a = 0.0
+        norm_b = 0.0
+        for x, y in zip(a, b):
+            dot += x * y
+            norm_a += x * x
+            norm_b += y * y
+        if norm_a == 0.0 or norm_b == 0.0:
+            return 0.0
+        return dot / (sqrt(norm_a) * sqrt(norm_b))
+
+    def _index_key(self, namespace: str) -> str:
+        return f"wizzy:cache:{namespace}:index"
+
+    def lookup(self, namespace: str, text: str) -> Tuple[Optional[str], Optional[List[float]]]:
+        """Return (cached response, prompt embedding) for a similar prompt
+
+        The embedding is returned even on a miss so the caller can pass it
+        back to store() and avoid a second embedContent round-trip.
+        """
+        embedding = None
+        try:
+            embedding = self._embed(text)
+            if not embedding:
+                return None, None
+
+            entry_keys = self.redis_client.lrange(self._index_key(namespace), 0, self.max_entries - 1)
+            if not entry_keys:
+                return None, embedding
+
+            pipe = self.redis_client.pipeline()
+            for key in entry_keys:
+                pipe.hmget(key, 'embedding', 'response')
+            entries = pipe.execute()
+
+            best_score = 0.0
+            best_response = None
+            for embedding_blob, response in entries:
+                if not embedding_blob or not response:
+                    continue  # Entry expired but still indexed
+                cached_vector = array('f')
+                cached_vector.frombytes(embedding_blob)
+                score = self._cosine_similarity(embedding, cached_vector)
+                if score > best_score:
+                    best_score = score
+                    best_response = response
+
+            if best_response is not None and best_score >= self.similarity_threshold:
+                logger.info(f"Semantic cache hit (similarity={best_score:.3f})")
+                if isinstance(best_response, bytes):
+                    best_response = best_response.decode()
+                return best_response, embedding
+
+            return None, embedding
+        except Exception as e:
+            logger.error(f"Error looking up semantic cache: {e}")
+            return None, embedding
+
+    def store(self, namespace: str, text: str, response: str,
+              embedding: Optional[List[float]] = None) -> None:
+        """Store a (prompt embedding, response) pair with a TTL
+
+        Pass the embedding returned by lookup() to reuse it; otherwise the
+        prompt is embedded here.
+        """
+        try:
+            if embedding is None:
+                embedding = self._embed(text)
+            if not embedding:
+                return
+
+            digest = hashlib.sha256(text.encode()).hexdigest()
+            entry_key = f"wizzy:cache:{namespace}:{digest}"
+
+            pipe = self.redis_client.pipeline()
+            pipe.hset(entry_key, mapping={
+                'embedding': array('f', embedding).tobytes(),
+                'response': response
+            })
+            pipe.expire(entry_key, self.ttl)
+            pipe.lpush(self._index_key(namespace), entry_key)
+            pipe.ltrim(self._index_key(namespace), 0, self.max_entries - 1)
+            pipe.expire(self._index_key(namespace), self.ttl)
+            pipe.execute()
+        except Exception as e:
+            logger.error(f"Error storing semantic cache entry: {e}")
@@ -4,34 +4,188 @@ Enhanced Serper API integration for Wizzy Bot
 Provides web search, news search, image search, and more
 """
 
+import asyncio
+import io
 import os
-import requests
+import urllib3
+from urllib3.util.retry import Retry
 import json
 import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
 from datetime import datetime
+from itertools import islice
+from functools import lru_cache
 from typing import Dict, Any, List, Optional
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+
+# orjson parses response bytes directly and is ~2x faster than stdlib
+# json on typical Serper payloads; fall back transparently if missing
+# httpx is optional: without it the async methods fall back to running
+# the sync client in a worker thread instead of a native async transport
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+try:
+    import orjson
+    _loads = orjson.loads
+    _dumps = orjson.dumps
+except ImportError:
+    _loads = json.loads
+
+    def _dumps(obj):
+        return json.dumps(obj).encode()
 
 logger = logging.getLogger(__name__)
 
-@dataclass
-class SearchResult:
-    """Data class for search results"""
-    title: str
-    snippet: str
-    link: str
-    position: int = 0
-    date: Optional[str] = None
-    image_url: Optional[str] = None
+# Where each search type keeps its result list in the raw response
+_RESULTS_KEY = {
+    "search": "organic",
+    "news": "news",
+    "images": "images",
+    "videos": "videos",
+    "shopping": "shopping"
+}
+
+# Output fields per search type as (attr, key, default) triples; one
+# table-driven comprehension replaces five near-identical loop methods
+_FIELDS = {
+    "search": (
+        ("title", "title", ""),
+        ("snippet", "snippet", ""),
+        ("link", "link", ""),
+        ("position", "position", 0),
+        ("date", "date", None)
+    ),
+    "news": (
+        ("title", "title", ""),
+        ("snippet", "snippet", ""),
+        ("link", "link", ""),
+        ("date", "date", None),
+        ("image_url", "imageUrl", None)
+    ),
+    "images": (
+        ("title", "title", ""),
+        ("snippet", "snippet", ""),
+        ("link", "link", ""),
+        ("image_url", "imageUrl", None)
+    ),
+    "videos": (
+        ("title", "title", ""),
+        ("snippet", "snippet", ""),
+        ("link", "link", ""),
+        ("image_url", "imageUrl", None)
+    ),
+    "shopping": (
+        ("title", "title", ""),
+        ("link", "link", ""),
+        ("image_url", "imageUrl", None)
+    )
+}
+
+def _compile_parsers() -> Dict[str, Any]:
+    """Generate a straight-line parser per search type from _FIELDS
+
+    The response schema is fixed, so each type gets a specialized
+    comprehension exec'd once at import: the generated code has the field
+    names and defaults as literals, with no inner loop over field triples.
+    """
+    parsers = {}
+    for search_type, fields in _FIELDS.items():
+        body = ", ".join(
+            f"{attr!r}: it.get({key!r}, {default!r})"
+            for attr, key, default in fields
+        )
+        src = f"def _parse(items):\n    return [{{{body}}} for it in items]\n"
+        namespace = {}
+        exec(compile(src, f"<serper parser: {search_type}>", "exec"), namespace)
+        parsers[search_type] = namespace["_parse"]
+    return parsers
+
+PARSERS = _compile_parsers()
+
+# Identical queries are stable for minutes and each call costs money and
+# a network round-trip, so successful responses are cached in-process
+SEARCH_CACHE_TTL = int(os.getenv('SERPER_CACHE_TTL', '600'))
+SEARCH_CACHE_MAX = 1024
+
+# Self-paced request rate, sized to the Serper plan's QPS; pacing up
+# front beats eating 429s and their retry latency
+SERPER_QPS = float(os.getenv('SERPER_QPS', '10'))
+
+class _TokenBucket:
+    """Token bucket shared by the sync and async request paths"""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.capacity = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """Take a token, returning how long to wait before proceeding"""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            # Over budget: wait until the deficit refills
+            return -self.tokens / self.rate
+
+    def acquire(self) -> None:
+        delay = self._reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    async def aacquire(self) -> None:
+        delay = self._reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+# Results and knowledge-graph entries are plain dicts: the formatters
+# only read a fixed set of keys, so per-item dataclass construction in
+# the processing loops was pure allocation overhead
 
 @dataclass
-class KnowledgeGraph:
-    """Data class for knowledge graph results"""
-    title: str
-    type: str
-    description: str
-    attributes: Dict[str, Any]
-    image_url: Optional[str] = None
+class SearchResultBatch:
+    """Column-oriented (structure-of-arrays) view of a result list
+
+    For bulk passes — reranking, dedupe, feeding a vectorized scorer — a
+    loop that touches only links iterates one contiguous list instead of
+    pulling every whole result dict through the cache.
+    """
+    titles: List[str] = field(default_factory=list)
+    snippets: List[str] = field(default_factory=list)
+    links: List[str] = field(default_factory=list)
+    positions: List[int] = field(default_factory=list)
+    dates: List[Optional[str]] = field(default_factory=list)
+
+    @classmethod
+    def from_results(cls, results: List[Dict[str, Any]]) -> "SearchResultBatch":
+        """Build the per-field columns from row dicts in one pass"""
+        batch = cls()
+        titles = batch.titles
+        snippets = batch.snippets
+        links = batch.links
+        positions = batch.positions
+        dates = batch.dates
+        for result in results:
+            titles.append(result.get("title", ""))
+            snippets.append(result.get("snippet", ""))
+            links.append(result.get("link", ""))
+            positions.append(result.get("position", 0))
+            dates.append(result.get("date"))
+        return batch
+
+    def __len__(self) -> int:
+        return len(self.titles)
 
 class SerperAPI:
     """Enhanced Serper API client with multiple search types"""
@@ -39,12 +193,48 @@ class SerperAPI:
     def __init__(self, api_key: str):
         self.api_key = api_key
         self.base_url = "https://google.serper.dev"
-        self.session = requests.Session()
-        self.session.headers.update({
-            "X-API-KEY": api_key,
-            "Content-Type": "application/json"
-        })
-    
+        # One warm TLS pool pinned to the Serper host; calling urllib3
+        # directly skips requests' PreparedRequest, cookie-jar and
+        # redirect machinery on every POST
+        self._pool = urllib3.HTTPSConnectionPool(
+            "google.serper.dev",
+            maxsize=20,
+            # Transient failures (rate caps, 5xx) retry with exponential
+            # backoff, honoring Retry-After, instead of surfacing an
+            # error dict on the first 429
+            retries=Retry(
+                total=3,
+                backoff_factor=0.3,
+                status_forcelist=(429, 500, 502, 503, 504),
+                allowed_methods=frozenset(["POST"]),
+                respect_retry_after_header=True
+            ),
+            headers={
+                "X-API-KEY": api_key,
+                "Content-Type": "application/json",
+                # Serper JSON is text-heavy; brotli shaves ~15-25% vs gzip
+                "Accept-Encoding": "br, gzip, deflate"
+            }
+        )
+        self._aclient = None
+        self._cache: OrderedDict = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._limiter = _TokenBucket(SERPER_QPS)
+        self._inflight: Dict[tuple, Future] = {}
+        self._inflight_lock = threading.Lock()
+
+    @property
+    def aclient(self) -> "httpx.AsyncClient":
+        """Lazily created shared async client (HTTP/2, bounded pool)"""
+        if self._aclient is None:
+            self._aclient = httpx.AsyncClient(
+                headers={"X-API-KEY": self.api_key, "Content-Type": "application/json"},
+                http2=True,
+                limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+                timeout=30.0
+            )
+        return self._aclient
+
     def web_search(self, query: str, num_results: int = 5, country: str = "us") -> Dict[str, Any]:
         """Perform a web search"""
         return self._search(query, "search", num_results, country)
@@ -65,31 +255,87 @@ class SerperAPI:
         """Perform a shopping search"""
         return self._search(query, "shopping", num_results)
     
-    def _search(self, query: str, search_type: str, num_results: int = 5, country: str = "us") -> Dict[str, Any]:
-        """Internal method to perform different types of searches"""
+    async def aweb_search(self, query: str, num_results: int = 5, country: str = "us") -> Dict[str, Any]:
+        """Perform a web search without blocking the event loop"""
+        return await self._asearch(query, "search", num_results, country)
+
+    async def anews_search(self, query: str, num_results: int = 5, country: str = "us") -> Dict[str, Any]:
+        """Perform a news search without blocking the event loop"""
+        return await self._asearch(query, "news", num_results, country)
+
+    async def aimage_search(self, query: str, num_results: int = 5) -> Dict[str, Any]:
+        """Perform an image search without blocking the event loop"""
+        return await self._asearch(query, "images", num_results)
+
+    async def avideo_search(self, query: str, num_results: int = 5) -> Dict[str, Any]:
+        """Perform a video search without blocking the event loop"""
+        return await self._asearch(query, "videos", num_results)
+
+    async def ashopping_search(self, query: str, num_results: int = 5) -> Dict[str, Any]:
+        """Perform a shopping search without blocking the event loop"""
+        return await self._asearch(query, "shopping", num_results)
+
+    def _cache_get(self, key) -> Optional[Dict[str, Any]]:
+        """Return a fresh cached response for key, or None"""
+        with self._cache_lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            timestamp, result = entry
+            if time.time() - timestamp >= SEARCH_CACHE_TTL:
+                del self._cache[key]
+                return None
+            self._cache.move_to_end(key)
+            return result
+
+    def _cache_put(self, key, result: Dict[str, Any]) -> None:
+        """Cache a response, evicting the least recently used past maxsize"""
+        with self._cache_lock:
+            self._cache[key] = (time.time(), result)
+            self._cache.move_to_end(key)
+            while len(self._cache) > SEARCH_CACHE_MAX:
+                self._cache.popitem(last=False)
+
+    def _build_payload(self, query: str, search_type: str, num_results: int, country: str) -> Dict[str, Any]:
+        """Build the request payload shared by the sync and async paths"""
+        payload = {
+            "q": query,
+            "num": num_results
+        }
+
+        # Add country for web and news searches
+        if search_type in ["search", "news"]:
+            payload["gl"] = country
+
+        return payload
+
+    async def _asearch(self, query: str, search_type: str, num_results: int = 5, country: str = "us") -> Dict[str, Any]:
+        """Async twin of _search; concurrent searches share one HTTP/2 pool"""
+        if httpx is None:
+            # No native async transport available: run the sync path in a
+            # worker thread so the event loop still stays unblocked
+            return await asyncio.to_thread(self._search, query, search_type, num_results, country)
+
+        cache_key = (search_type, query.lower(), num_results, country)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return cached
+
         try:
-            url = f"{self.base_url}/{search_type}"
-            
-            payload = {
-                "q": query,
-                "num": num_results
-            }
-            
-            # Add country for web and news searches
-            if search_type in ["search", "news"]:
-                payload["gl"] = country
-            
-            response = self.session.post(url, json=payload)
+            payload = self._build_payload(query, search_type, num_results, country)
+            await self._limiter.aacquire()
+            response = await self.aclient.post(f"{self.base_url}/{search_type}", content=_dumps(payload))
             response.raise_for_status()
-            
-            search_data = response.json()
-            return self._process_search_response(search_data, query, search_type)
-            
-        except requests.exceptions.HTTPError as e:
+            result = self._process_search_response(_loads(response.content), query, search_type)
+            self._cache_put(cache_key, result)
+            return result
+
+        except httpx.HTTPStatusError as e:
             logger.error(f"HTTP Error in {search_type} search: {e}")
+            status_code = e.response.status_code
             return {
                 "success": False,
-                "error": f"HTTP {response.status_code}: {self._get_error_message(response.status_code)}",
+                "error": f"HTTP {status_code}: {self._get_error_message(status_code)}",
                 "results": [],
                 "search_type": search_type
             }
@@ -101,24 +347,172 @@ class SerperAPI:
                 "results": [],
                 "search_type": search_type
             }
+
+    def _search(self, query: str, search_type: str, num_results: int = 5, country: str = "us") -> Dict[str, Any]:
+        """Internal method to perform different types of searches"""
+        cache_key = (search_type, query.lower(), num_results, country)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return cached
+
+        # Coalesce concurrent identical requests: the first caller does
+        # the network round-trip, everyone else waits on its Future
+        with self._inflight_lock:
+            future = self._inflight.get(cache_key)
+            is_owner = future is None
+            if is_owner:
+                future = Future()
+                self._inflight[cache_key] = future
+
+        if not is_owner:
+            return future.result()
+
+        try:
+            result = self._request(query, search_type, num_results, country, cache_key)
+            future.set_result(result)
+            return result
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(cache_key, None)
+
+    def _request(self, query: str, search_type: str, num_results: int, country: str, cache_key) -> Dict[str, Any]:
+        """Perform one search round-trip; always returns a response dict"""
+        try:
+            payload = self._build_payload(query, search_type, num_results, country)
+
+            self._limiter.acquire()
+            response = self._pool.urlopen("POST", f"/{search_type}", body=_dumps(payload))
+            if response.status >= 400:
+                logger.error(f"HTTP Error in {search_type} search: {response.status}")
+                return {
+                    "success": False,
+                    "error": f"HTTP {response.status}: {self._get_error_message(response.status)}",
+                    "results": [],
+                    "search_type": search_type
+                }
+
+            search_data = _loads(response.data)
+            result = self._process_search_response(search_data, query, search_type)
+            self._cache_put(cache_key, result)
+            return result
+
+        except Exception as e:
+            logger.error(f"Error in {search_type} search: {e}")
+            return {
+                "success": False,
+                "error": str(e),
+                "results": [],
+                "search_type": search_type
+            }
     
+    def multi_search(self, specs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Run several searches in one batched POST
+
+        Serper accepts a list body on /search, so web + news + images for
+        one user turn cost a single round-trip instead of three. Each spec
+        needs 'q' plus optional 'type' (search/news/images/videos/shopping),
+        'num' and 'gl'. Returns one processed response dict per spec, in
+        order.
+        """
+        if not specs:
+            return []
+
+        payload = []
+        types = []
+        for spec in specs:
+            search_type = spec.get("type", "search")
+            types.append(search_type)
+            entry = {"q": spec["q"], "num": spec.get("num", 5)}
+            if search_type in ["search", "news"]:
+                entry["gl"] = spec.get("gl", "us")
+            if search_type != "search":
+                entry["type"] = search_type
+            payload.append(entry)
+
+        try:
+            self._limiter.acquire()
+            response = self._pool.urlopen("POST", "/search", body=_dumps(payload))
+            if response.status >= 400:
+                raise RuntimeError(f"HTTP {response.status}: {self._get_error_message(response.status)}")
+            batch = _loads(response.data)
+        except Exception as e:
+            logger.error(f"Error in batch search: {e}")
+            return [{
+                "success": False,
+                "error": str(e),
+                "results": [],
+                "search_type": search_type
+            } for search_type in types]
+
+        return [
+            self._process_search_response(data, spec["q"], search_type)
+            for data, spec, search_type in zip(batch, specs, types)
+        ]
+
+    def search_and_format_for_ai(self, query: str, search_type: str = "search",
+                                 num_results: int = 5, country: str = "us") -> Optional[str]:
+        """Search and build the AI context string in one pass over the raw JSON
+
+        Fuses fetch, parse and formatting: the top five raw items are
+        written straight into a StringIO, skipping the intermediate
+        results list entirely. Returns None when the search fails or
+        yields nothing.
+        """
+        cache_key = ("ai:" + search_type, query.lower(), num_results, country)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return cached
+
+        try:
+            self._limiter.acquire()
+            response = self._pool.urlopen(
+                "POST", f"/{search_type}",
+                body=_dumps(self._build_payload(query, search_type, num_results, country))
+            )
+            if response.status >= 400:
+                logger.error(f"HTTP Error in {search_type} search: {response.status}")
+                return None
+            data = _loads(response.data)
+        except Exception as e:
+            logger.error(f"Error in {search_type} search: {e}")
+            return None
+
+        knowledge_graph = data.get("knowledgeGraph") if search_type == "search" else None
+        items = data.get(_RESULTS_KEY.get(search_type, search_type), [])
+        if not knowledge_graph and not items:
+            return None
+
+        buffer = io.StringIO()
+        buffer.write(f"Search results for '{query}':\n\n")
+
+        if knowledge_graph:
+            buffer.write(f"Key Information: {knowledge_graph.get('title', '')} ({knowledge_graph.get('type', '')})\n")
+            buffer.write(f"{knowledge_graph.get('description', '')}\n\n")
+
+        for item in items[:5]:  # Limit to top 5 for context
+            buffer.write(f"- {item.get('title', '')}\n")
+            buffer.write(f"  {item.get('snippet', '')}\n")
+            if item.get("date"):
+                buffer.write(f"  Date: {item['date']}\n")
+            buffer.write(f"  Source: {item.get('link', '')}\n\n")
+
+        formatted = buffer.getvalue()
+        self._cache_put(cache_key, formatted)
+        return formatted
+
     def _process_search_response(self, data: Dict[str, Any], query: str, search_type: str) -> Dict[str, Any]:
         """Process and structure the search response"""
         results = []
         knowledge_graph = None
         
-        # Process different result types based on search type
+        # Process different result types via the generated parsers
+        if search_type == "shopping":
+            results = self._process_shopping_results(data.get("shopping", []))
+        elif search_type in PARSERS:
+            results = PARSERS[search_type](data.get(_RESULTS_KEY[search_type], []))
+
         if search_type == "search":
-            results = self._process_organic_results(data.get("organic", []))
             knowledge_graph = self._process_knowledge_graph(data.get("knowledgeGraph"))
-        elif search_type == "news":
-            results = self._process_news_results(data.get("news", []))
-        elif search_type == "images":
-            results = self._process_image_results(data.get("images", []))
-        elif search_type == "videos":
-            results = self._process_video_results(data.get("videos", []))
-        elif search_type == "shopping":
-            results = self._process_shopping_results(data.get("shopping", []))
         
         return {
             "success": True,
@@ -130,80 +524,25 @@ class SerperAPI:
             "timestamp": datetime.now().isoformat()
         }
     
-    def _process_organic_results(self, organic_data: List[Dict]) -> List[SearchResult]:
-        """Process organic search results"""
-        results = []
-        for item in organic_data:
-            results.append(SearchResult(
-                title=item.get("title", ""),
-                snippet=item.get("snippet", ""),
-                link=item.get("link", ""),
-                position=item.get("position", 0),
-                date=item.get("date")
-            ))
+    def _process_shopping_results(self, shopping_data: List[Dict]) -> List[Dict[str, Any]]:
+        """Process shopping search results (snippet includes the price)"""
+        results = PARSERS["shopping"](shopping_data)
+        for result, item in zip(results, shopping_data):
+            result["snippet"] = f"Price: {item.get('price', 'N/A')} - {item.get('snippet', '')}"
         return results
-    
-    def _process_news_results(self, news_data: List[Dict]) -> List[SearchResult]:
-        """Process news search results"""
-        results = []
-        for item in news_data:
-            results.append(SearchResult(
-                title=item.get("title", ""),
-                snippet=item.get("snippet", ""),
-                link=item.get("link", ""),
-                date=item.get("date"),
-                image_url=item.get("imageUrl")
-            ))
-        return results
-    
-    def _process_image_results(self, image_data: List[Dict]) -> List[SearchResult]:
-        """Process image search results"""
-        results = []
-        for item in image_data:
-            results.append(SearchResult(
-                title=item.get("title", ""),
-                snippet=item.get("snippet", ""),
-                link=item.get("link", ""),
-                image_url=item.get("imageUrl")
-            ))
-        return results
-    
-    def _process_video_results(self, video_data: List[Dict]) -> List[SearchResult]:
-        """Process video search results"""
-        results = []
-        for item in video_data:
-            results.append(SearchResult(
-                title=item.get("title", ""),
-                snippet=item.get("snippet", ""),
-                link=item.get("link", ""),
-                image_url=item.get("imageUrl")
-            ))
-        return results
-    
-    def _process_shopping_results(self, shopping_data: List[Dict]) -> List[SearchResult]:
-        """Process shopping search results"""
-        results = []
-        for item in shopping_data:
-            results.append(SearchResult(
-                title=item.get("title", ""),
-                snippet=f"Price: {item.get('price', 'N/A')} - {item.get('snippet', '')}",
-                link=item.get("link", ""),
-                image_url=item.get("imageUrl")
-            ))
-        return results
-    
-    def _process_knowledge_graph(self, kg_data: Optional[Dict]) -> Optional[KnowledgeGraph]:
+
+    def _process_knowledge_graph(self, kg_data: Optional[Dict]) -> Optional[Dict[str, Any]]:
         """Process knowledge graph data"""
         if not kg_data:
             return None
-        
-        return KnowledgeGraph(
-            title=kg_data.get("title", ""),
-            type=kg_data.get("type", ""),
-            description=kg_data.get("description", ""),
-            attributes=kg_data.get("attributes", {}),
-            image_url=kg_data.get("imageUrl")
-        )
+
+        return {
+            "title": kg_data.get("title", ""),
+            "type": kg_data.get("type", ""),
+            "description": kg_data.get("description", ""),
+            "attributes": kg_data.get("attributes", {}),
+            "image_url": kg_data.get("imageUrl")
+        }
     
     def _get_error_message(self, status_code: int) -> str:
         """Get user-friendly error messages"""
@@ -216,47 +555,54 @@ class SerperAPI:
         }
         return error_messages.get(status_code, "Unknown error occurred")
 
+# Row templates hoisted out of the format loops so the emoji/markdown
+# scaffolding is built once instead of re-parsed per f-string per result
+_KG_ROW = "💡 **{title}** ({type})\n   {description}\n\n"
+_WEB_ROW = "{i}. **{title}**\n   {snippet}\n   🔗 {link}\n\n"
+_NEWS_ROW_DATE = "{i}. **{title}**\n   {snippet}\n   📅 {date}\n   🔗 {link}\n\n"
+_NEWS_ROW_NODATE = "{i}. **{title}**\n   {snippet}\n   🔗 {link}\n\n"
+
 class SearchFormatter:
     """Format search results for AI consumption"""
-    
+
     @staticmethod
     def format_web_search(search_data: Dict[str, Any]) -> str:
         """Format web search results"""
         if not search_data["success"] or not search_data["results"]:
             return f"❌ Web search failed: {search_data.get('error', 'No results found')}"
-        
-        formatted = f"🌐 Web search results for: '{search_data['query']}'\n\n"
-        
+
+        parts = [f"🌐 Web search results for: '{search_data['query']}'\n\n"]
+
         # Add knowledge graph
         if search_data.get("knowledge_graph"):
             kg = search_data["knowledge_graph"]
-            formatted += f"💡 **{kg.title}** ({kg.type})\n"
-            formatted += f"   {kg.description}\n\n"
-        
+            parts.append(_KG_ROW.format(title=kg["title"], type=kg["type"],
+                                        description=kg["description"]))
+
         # Add search results
         for i, result in enumerate(search_data["results"], 1):
-            formatted += f"{i}. **{result.title}**\n"
-            formatted += f"   {result.snippet}\n"
-            formatted += f"   🔗 {result.link}\n\n"
-        
-        return formatted
-    
+            parts.append(_WEB_ROW.format(i=i, title=result["title"],
+                                         snippet=result["snippet"],
+                                         link=result["link"]))
+
+        return "".join(parts)
+
     @staticmethod
     def format_news_search(search_data: Dict[str, Any]) -> str:
         """Format news search results"""
         if not search_data["success"] or not search_data["results"]:
             return f"❌ News search failed: {search_data.get('error', 'No results found')}"
-        
-        formatted = f"📰 News results for: '{search_data['query']}'\n\n"
-        
+
+        parts = [f"📰 News results for: '{search_data['query']}'\n\n"]
+
         for i, result in enumerate(search_data["results"], 1):
-            formatted += f"{i}. **{result.title}**\n"
-            formatted += f"   {result.snippet}\n"
-            if result.date:
-                formatted += f"   📅 {result.date}\n"
-            formatted += f"   🔗 {result.link}\n\n"
-        
-        return formatted
+            row = _NEWS_ROW_DATE if result.get("date") else _NEWS_ROW_NODATE
+            parts.append(row.format(i=i, title=result["title"],
+                                    snippet=result["snippet"],
+                                    date=result.get("date"),
+                                    link=result["link"]))
+
+        return "".join(parts)
     
     @staticmethod
     def format_for_ai_context(search_data: Dict[str, Any]) -> str:
@@ -264,31 +610,36 @@ class SearchFormatter:
         if not search_data["success"] or not search_data["results"]:
             return "No relevant search results found."
         
-        context = f"Search results for '{search_data['query']}':\n\n"
-        
+        parts = [f"Search results for '{search_data['query']}':\n\n"]
+
         # Add knowledge graph first
         if search_data.get("knowledge_graph"):
             kg = search_data["knowledge_graph"]
-            context += f"Key Information: {kg.title} ({kg.type})\n"
-            context += f"{kg.description}\n\n"
-        
-        # Add top results
-        for result in search_data["results"][:5]:  # Limit to top 5 for context
-            context += f"- {result.title}\n"
-            context += f"  {result.snippet}\n"
-            if hasattr(result, 'date') and result.date:
-                context += f"  Date: {result.date}\n"
-            context += f"  Source: {result.link}\n\n"
-        
-        return context
+            parts.append(f"Key Information: {kg['title']} ({kg['type']})\n{kg['description']}\n\n")
+
+        # Add top results without materializing an intermediate slice
+        for result in islice(search_data["results"], 5):  # Limit to top 5 for context
+            parts.append(f"- {result['title']}\n  {result['snippet']}\n")
+            if result.get("date"):
+                parts.append(f"  Date: {result['date']}\n")
+            parts.append(f"  Source: {result['link']}\n\n")
+
+        return "".join(parts)
 
 # Utility functions for easy integration
+@lru_cache(maxsize=8)
+def _get_client(api_key: str) -> SerperAPI:
+    """Shared client per API key so the connection pool survives across calls"""
+    return SerperAPI(api_key)
+
 def quick_web_search(query: str, api_key: str, num_results: int = 5) -> Dict[str, Any]:
     """Quick web search function"""
-    serper = SerperAPI(api_key)
-    return serper.web_search(query, num_results)
+    return _get_client(api_key).web_search(query, num_results)
 
 def quick_news_search(query: str, api_key: str, num_results: int = 5) -> Dict[str, Any]:
     """Quick news search function"""
-    serper = SerperAPI(api_key)
-    return serper.news_search(query, num_results)
+    return _get_client(api_key).news_search(query, num_results)
+
+def quick_multi_search(specs: List[Dict[str, Any]], api_key: str) -> List[Dict[str, Any]]:
+    """Run several search specs in one batched request"""
+    return _get_client(api_key).multi_search(specs)